@@ -0,0 +1,6 @@
+'''
+Shared helpers for the MTG-OhioU constructor pages.
+
+The pages in ``pages/`` keep their Streamlit layout; the numerical kernels and
+file writers that more than one constructor needs live here.
+'''
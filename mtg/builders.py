@@ -0,0 +1,620 @@
+import numpy as np
+from mtg.model import Model, PoscarFile
+from mtg.placement import CellList, positionArray, placeAtoms, releasePositions, minimumImage, boxSampler, layeredSampler, cylinderSampler, sphereSampler
+from mtg.poscar import poscarHeader, coordinateChunks, writePoscar
+from mtg.preview import sampleRows
+from mtg.porosity import poreCoverage, modelPores
+from mtg.seeding import newSeed, generator, childGenerators, seededComment, UniformBlocks
+from mtg.species import checkCutoffs, speciesLabels
+
+### The constructor algorithms of the pages, as plain functions so they can run in a worker process.
+### composition maps each species to its number of atoms, e.g. {"C": 1000, "N": 20}, and cutoffs is the
+### symmetric matrix of minimum distances between the species (in the same order), or one cutoff for all pairs.
+### engine is one of ENGINES: "cell-list", the vectorised kernel in mtg.placement, or "reference", the original
+### restart-from-zero loop of the pages (carbon only), kept to check new engines against (see mtg.equivalence).
+### seed fixes every random draw (see mtg.seeding), a fresh one is used when it is None. It is written in the
+### POSCAR comment line with the engine, large-model mode and tiles, so the model can be generated again bit for bit.
+### progress, if given, is called with the fraction of atoms placed.
+
+ENGINES = ["cell-list", "reference"]
+
+
+def _largeModel(pos, comment, box, species, counts, extras=None):
+    '''
+    Writes a disk-backed position array straight to a POSCAR file (large-model mode)
+    '''
+    header = poscarHeader(comment, box, (1.0, 1.0, 1.0), species, counts)
+    path = writePoscar(None, header, pos, box)
+    preview = header + next(coordinateChunks(pos[:20], box))
+
+    keep, sample_counts = sampleRows(counts, counts[0] if extras and "pore_radii" in extras else 0)
+    sample = Model(comment, box, (1.0, 1.0, 1.0), species, sample_counts, pos[keep]/box, extras=extras)
+    return PoscarFile(path, preview, sample)
+
+
+def _composition(composition, cutoffs, engine="cell-list", large=False):
+    '''
+    Splits a composition into its species and counts and checks the cutoffs and the engine against it
+    '''
+    species = list(composition)
+    counts = [int(composition[s]) for s in species]
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, choose from {', '.join(ENGINES)}.")
+    if engine == "reference" and (species != ["C"] or large):
+        raise ValueError("The reference engine only places carbon atoms, in memory. Use the cell-list engine.")
+    return species, counts, checkCutoffs(cutoffs, len(species))
+
+
+def _seed(seed, comment, engine="cell-list", large=False, tiles=None):
+    if seed is None:
+        seed = newSeed()
+    return seed, seededComment(comment, seed, engine, large, tiles)
+
+
+def _speciesBlocks(pos, labels, num_species):
+    '''
+    Reorders the rows of pos in place so that the species come in blocks, as the POSCAR lists them.
+    Returns the number of atoms of each species.
+    '''
+    order = np.argsort(labels, kind="stable")
+    pos[:] = pos[order]
+    return np.bincount(labels, minlength=num_species).tolist()
+
+
+def _missingAtoms(species, counts, existing):
+    '''
+    Number of atoms of each species still to place around the existing ones (species indices)
+    '''
+    missing = np.asarray(counts) - np.bincount(existing, minlength=len(species))
+    if np.any(missing < 0):
+        extra = ", ".join(f"{-n} {s}" for s, n in zip(species, missing) if n < 0)
+        raise ValueError(f"The model already has more atoms than requested ({extra} too many).")
+    return missing
+
+
+def _extensionLabels(species, counts, existing, rng=None):
+    '''
+    Species indices for a model being extended: the atoms already placed (existing) first,
+    then the atoms still missing from the composition, in random order
+    '''
+    return np.concatenate([existing, speciesLabels(_missingAtoms(species, counts, existing), rng)]).astype(np.int8)
+
+
+def checkExtension(model, composition, skip=0):
+    '''
+    Raises ValueError when model cannot be extended to composition: it holds a species the composition lacks, or more
+    atoms of one than requested. skip leaves out its first species blocks (the pores of porous carbon). Lets the pages
+    refuse an extension before it is submitted.
+    '''
+    species = list(composition)
+    _missingAtoms(species, [int(composition[s]) for s in species], _modelLabels(model, species, skip))
+
+
+def _modelLabels(model, species, skip=0):
+    '''
+    Species indices (in the new composition) of the atoms of an existing model, leaving out its first skip species blocks
+    '''
+    unknown = [s for s in model.species[skip:] if s not in species]
+    if unknown:
+        raise ValueError(f"The model contains {', '.join(unknown)}, which is not in the composition.")
+    return np.repeat([species.index(s) for s in model.species[skip:]], model.counts[skip:]).astype(np.int8)
+
+
+##################### Supercell tiling #######################################################################################
+### A very large box can be built as tiles x tiles x tiles smaller periodic cells, each placed on its own (and in parallel
+### with workers > 1) from its own child stream of the seed, so no two tiles are alike. Across the tile faces atoms may then
+### be closer than the cutoff; the seam repair removes one atom of every such pair and places it again in the whole box.
+### Tiling is for headless builds (scripts and batch jobs calling the builders): in the app every job worker already has
+### a CPU of its own, so the pages build very large boxes in one piece.
+
+def _tileShape(tiles):
+    tiles = np.broadcast_to(np.asarray(tiles, dtype=np.int64), (3,)).copy()
+    if np.any(tiles < 1):
+        raise ValueError("The number of tiles along every axis must be at least 1.")
+    return tiles
+
+
+def _poreFreeSampler(sampler, origin, box, pore_centers, pore_radii):
+    '''
+    Wraps a tile's sampler so that it only returns candidates outside the pores of the whole (periodic) box
+    '''
+    radii2 = np.asarray(pore_radii, dtype=np.float64)**2
+    def sample(rng, size):
+        kept = []
+        while sum(len(k) for k in kept) < size:
+            atoms = sampler(rng, size)
+            d = minimumImage(atoms[:, None, :] + origin - pore_centers[None, :, :], box)
+            kept.append(atoms[~np.any(np.einsum("ijk,ijk->ij", d, d) < radii2, axis=1)])
+        return np.concatenate(kept)[:size]
+    return sample
+
+
+def _placeTile(num_atoms, tile_box, origin, cutoffs, labels, rng, box, layers=None, pore_centers=None, pore_radii=None):
+    '''
+    Atoms of one tile, placed periodically in the tile box. Returns their positions in the whole box and their species.
+    '''
+    sampler = boxSampler(tile_box) if layers is None else layeredSampler(tile_box, *layers)
+    if pore_centers is not None and len(pore_centers):
+        sampler = _poreFreeSampler(sampler, origin, box, pore_centers, pore_radii)
+    pos = np.zeros((num_atoms, 3))
+    placeAtoms(pos, tile_box, cutoffs, labels=labels, rng=rng, sampler=sampler)
+    return pos + origin, labels
+
+
+def _tileCounts(num_atoms, tiles, box, pore_centers=None, pore_radii=None, rng=None):
+    '''
+    Number of atoms in every tile: the same in all of them, or in proportion to their volume outside the pores
+    '''
+    num_tiles = int(np.prod(tiles))
+    share = np.full(num_tiles, 1.0 / num_tiles)
+    if pore_centers is not None and len(pore_centers):
+        grid = max(96, 8 * int(tiles.max()))
+        coverage, _ = poreCoverage(pore_centers, pore_radii, box, grid, rng)
+        ## tile of every grid cell, from the cell centre
+        ijk = ((np.arange(grid) + 0.5)[:, None] / grid * tiles[None, :]).astype(np.int64)
+        tile = ((ijk[:, 0][:, None, None] * tiles[1] + ijk[:, 1][None, :, None]) * tiles[2] + ijk[:, 2][None, None, :]).ravel()
+        share = np.bincount(tile, weights=coverage == 0, minlength=num_tiles)
+        if share.sum() == 0:
+            raise RuntimeError("The pores fill the whole box, there is no room for atoms.")
+        share /= share.sum()
+    ## largest remainder, so the counts add up exactly
+    counts = np.floor(share * num_atoms).astype(np.int64)
+    counts[np.argsort(counts - share * num_atoms)[:num_atoms - counts.sum()]] += 1
+    return counts
+
+
+def _seamConflicts(pos, labels, box, cutoffs, tile_box, tiles, chunk=65536):
+    '''
+    Rows to remove so that no two atoms of different tiles are closer than their cutoff (the later atom of every pair)
+    '''
+    cutoff2 = np.asarray(cutoffs, dtype=np.float64)**2
+    reach = np.sqrt(cutoff2.max())
+    local = pos % tile_box
+    near = np.any(((local < reach) | (local > tile_box - reach)) & (tiles > 1), axis=1)
+    seam = np.flatnonzero(near)
+
+    cells = CellList(box, reach)
+    cells.insert(seam.astype(np.int32), pos[seam])
+    remove = []
+    for start in range(0, len(seam), chunk):
+        rows = seam[start:start + chunk]
+        nb = cells.neighbours(pos[rows])
+        valid = nb > rows[:, None]   # every pair once, empty slots are -1
+        nb = np.where(valid, nb, 0)
+        d = minimumImage(pos[nb] - pos[rows][:, None, :], box)
+        close = valid & (np.einsum("ijk,ijk->ij", d, d) < cutoff2[labels[rows][:, None], labels[nb]])
+        remove.append(nb[close])
+    return np.unique(np.concatenate(remove)) if remove else np.zeros(0, dtype=np.int64)
+
+
+def _tiledPlacement(out, box, cutoffs, tiles, labels, seed, layers=None, pore_centers=None, pore_radii=None, workers=1, progress=None):
+    '''
+    Fills out like placeAtoms, tile by tile, then repairs the seams. labels are reordered with the rows.
+    '''
+    box = np.broadcast_to(np.asarray(box, dtype=np.float64), (3,))
+    tile_box = box / tiles
+    num_tiles = int(np.prod(tiles))
+    rngs = childGenerators(seed, "tiles", num_tiles + 1)
+    tile_counts = _tileCounts(len(out), tiles, box, pore_centers, pore_radii, rngs[-1])
+    bounds = np.concatenate([[0], np.cumsum(tile_counts)])
+    origins = [np.array(ijk) * tile_box for ijk in np.ndindex(*tiles)]
+    jobs = [(int(tile_counts[i]), tile_box, origins[i], cutoffs, labels[bounds[i]:bounds[i+1]].copy(), rngs[i], box, layers, pore_centers, pore_radii)
+            for i in range(num_tiles)]
+
+    def collect(i, result):
+        out[bounds[i]:bounds[i+1]], labels[bounds[i]:bounds[i+1]] = result
+        if progress is not None:
+            progress(0.9 * (i + 1) / num_tiles)
+
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(workers) as pool:
+            for i, result in enumerate(pool.map(_placeTile, *zip(*jobs))):
+                collect(i, result)
+    else:
+        for i, job in enumerate(jobs):
+            collect(i, _placeTile(*job))
+
+    ## Seam repair: the atoms of the clashing pairs go to the end and are placed again in the whole box
+    remove = _seamConflicts(np.asarray(out, dtype=np.float64), labels, box, cutoffs, tile_box, tiles)
+    if len(remove):
+        keep = np.ones(len(out), dtype=bool)
+        keep[remove] = False
+        order = np.concatenate([np.flatnonzero(keep), remove])
+        out[:] = out[order]
+        labels[:] = labels[order]
+        placeAtoms(out, box, cutoffs, pore_centers=pore_centers, pore_radii=pore_radii, start=len(out) - len(remove), labels=labels,
+                   rng=generator(seed, "seams"))
+    if progress is not None:
+        progress(1.0)
+    return len(remove)
+
+
+def amorphousGraphite(composition, box, cutoffs, comment, large=False, engine="cell-list", seed=None, progress=None, layers=None, tiles=None, workers=1):
+    '''
+    Distributes the atoms randomly in a periodic cubic box, no two closer than the cutoff of their species pair
+
+    layers = (spacing, disorder, fraction) seeds the atoms preferentially in a stack of planes normal to z
+    (see placement.layeredSampler) instead of uniformly, so the model starts closer to the layered sp2 structure.
+    tiles = n or (n, m, k) builds the box as that many independent periodic tiles and repairs the seams (see _tiledPlacement).
+    '''
+    species, counts, cutoffs = _composition(composition, cutoffs, engine, large)
+    seed, comment = _seed(seed, comment, engine, large, tiles)
+    if engine == "reference":
+        if layers is not None or tiles is not None:
+            raise ValueError("The reference engine only seeds uniformly in one piece. Use the cell-list engine for layered seeding or tiling.")
+        return _amorphousGraphiteLoop(counts[0], box, cutoffs[0, 0], comment, UniformBlocks(generator(seed, "reference")), progress)
+
+    pos = positionArray(sum(counts), large=large)
+    ## the file behind a large-model array goes away also when placement fails or the job is cancelled
+    try:
+        labels = speciesLabels(counts, generator(seed, "species"))
+        if tiles is not None:
+            _tiledPlacement(pos, box, cutoffs, _tileShape(tiles), labels, seed, layers=layers, workers=workers, progress=progress)
+        else:
+            sampler = None if layers is None else layeredSampler(box, *layers)
+            placeAtoms(pos, box, cutoffs, labels=labels, progress=progress, rng=generator(seed, "cell-list"), sampler=sampler)
+        counts = _speciesBlocks(pos, labels, len(species))
+        if large:
+            return _largeModel(pos, comment, box, species, counts)
+        return Model(comment, box, (1.0, 1.0, 1.0), species, counts, pos/box)
+    finally:
+        releasePositions(pos)
+
+
+def _amorphousGraphiteLoop(num_atoms, box, cutoff, comment, ran, progress=None):
+    pos = np.zeros([num_atoms,3],float)   ## A list that takes in the position of the atoms
+
+    ct = 0
+    rnd = lambda i: i-round(i/box)*box  ## This makes rnd a function that takes i and perform i - round(i/box)*box
+    vec_rnd = np.vectorize(rnd)         ## takes  a function and gives result in a callable vectorised function
+
+    while ct < num_atoms:
+        atoms =[box*ran.random(),box*ran.random(),box*ran.random()]
+        test = 0
+
+        while test < ct:
+            atom_distance = atoms-pos[test][:]
+            atom_distance = vec_rnd(atom_distance)
+
+            ### Position the atoms if atoms are not close to center
+            if sum(map(lambda i: i*i, atom_distance)) < cutoff**2:
+                atoms =np.array([box*ran.random(),box*ran.random(),box*ran.random()])
+                test = 0
+            else:
+                test += 1
+
+        pos[ct][:] = atoms
+
+        ct +=1
+        if progress is not None:
+            progress(ct/num_atoms)
+        print (f"Placing Atom number {ct} of {num_atoms}", end='\r')
+
+    return Model(comment, box, (1.0, 1.0, 1.0), ["C"], [num_atoms], pos/box)
+
+
+def porousCarbon(composition, num_pores, box, cutoffs, pore_overlap, poreRadii_list, comment, large=False, engine="cell-list", seed=None, progress=None, tiles=None, workers=1):
+    '''
+    Places the pore centers (written as O) and then the atoms outside the pores
+
+    tiles = n or (n, m, k) places the atoms as that many independent periodic tiles around the pores of the whole box,
+    each with atoms in proportion to its volume outside the pores, and repairs the seams (see _tiledPlacement).
+    '''
+    species, counts, cutoffs = _composition(composition, cutoffs, engine, large)
+    if "O" in species:
+        raise ValueError("Oxygen marks the pores of porous carbon models and cannot be used as a dopant.")
+    if engine == "reference" and tiles is not None:
+        raise ValueError("The reference engine places the atoms in one piece. Use the cell-list engine for tiling.")
+    seed, comment = _seed(seed, comment, engine, large, tiles)
+    num_atoms = sum(counts)
+    cutoff = cutoffs[0, 0]
+    pos = positionArray(num_atoms+num_pores, large=large)   ## A list that takes in the position of the atoms and pores
+
+    ct = 0
+    rnd = lambda i: i-round(i/box)*box  ## This makes rnd a function that takes i and perform i - round(i/box)*box
+    vec_rnd = np.vectorize(rnd)         ## takes  a function and gives result in a callable vectorised function
+
+    print ("Now creating the center of the foams")
+    ran = UniformBlocks(generator(seed, "pores"))
+
+    while ct < num_pores:
+
+        center =np.array([box*ran.random(),box*ran.random(),box*ran.random()])
+        test = 0
+        while test < ct:
+            pore_distance = center-pos[test][:]
+            pore_distance = vec_rnd(pore_distance)
+
+            if sum(map(lambda i: i*i, pore_distance)) < (pore_overlap*poreRadii_list[test])**2:
+                center =np.array([box*ran.random(),box*ran.random(),box*ran.random()])
+                test = 0
+            else:
+                test +=1
+
+        pos[ct][:] = center[:]
+
+        ct += 1
+
+    if engine == "cell-list":
+        ## Like the loop below, atoms are kept out of every pore, including the last one that tops up the porosity.
+        ## The file behind a large-model array goes away also when placement fails or the job is cancelled
+        try:
+            labels = speciesLabels(counts, generator(seed, "species"))
+            if tiles is not None:
+                _tiledPlacement(pos[num_pores:], box, cutoffs, _tileShape(tiles), labels, seed, pore_centers=np.asarray(pos[:num_pores], dtype=np.float64),
+                                pore_radii=poreRadii_list, workers=workers, progress=progress)
+            else:
+                placeAtoms(pos[num_pores:], box, cutoffs, pore_centers=pos[:num_pores], pore_radii=poreRadii_list, labels=labels, progress=progress,
+                           rng=generator(seed, "cell-list"))
+            counts = _speciesBlocks(pos[num_pores:], labels, len(species))
+            if large:
+                return _largeModel(pos, comment, box, ["O"] + species, [num_pores] + counts, extras={"pore_radii": poreRadii_list})
+            return Model(comment, box, (1.0, 1.0, 1.0), ["O"] + species, [num_pores] + counts, pos/box, extras={"pore_radii": poreRadii_list})
+        finally:
+            releasePositions(pos)
+
+    ran = UniformBlocks(generator(seed, "reference"))
+    while ct < num_atoms+num_pores:
+        atoms =[box*ran.random(),box*ran.random(),box*ran.random()]
+        test = 0
+
+        while test < ct:
+            atom_distance = atoms-pos[test][:]
+            atom_distance = vec_rnd(atom_distance)
+
+            # Make sure atoms are not close to the pore center
+            if test < num_pores and sum(map(lambda i: i*i, atom_distance)) < poreRadii_list[test]**2:
+                atoms =np.array([box*ran.random(),box*ran.random(),box*ran.random()])
+                test = 0
+
+            ### Position the atoms if atoms are not close to center
+            elif sum(map(lambda i: i*i, atom_distance)) < cutoff**2 and test >= num_pores:
+                atoms =np.array([box*ran.random(),box*ran.random(),box*ran.random()])
+                test = 0
+            else:
+                test += 1
+
+        pos[ct][:] = atoms
+
+        ct +=1
+        if progress is not None:
+            progress((ct-num_pores)/num_atoms)
+        print (f"Placing Atom number {ct-num_pores} of {num_atoms}", end='\r')
+
+    return Model(comment, box, (1.0, 1.0, 1.0), ["O", "C"], [num_pores, num_atoms], pos/box, extras={"pore_radii": poreRadii_list})
+
+
+def carbonNanotube(composition, radius, height, vacuum, cutoffs, comment, engine="cell-list", seed=None, progress=None):
+    '''
+    Distributes the atoms randomly in a cylinder of the given radius and height (periodic along z)
+    '''
+    species, counts, cutoffs = _composition(composition, cutoffs, engine)
+    seed, comment = _seed(seed, comment, engine)
+    if engine == "reference":
+        return _carbonNanotubeLoop(counts[0], radius, height, vacuum, cutoffs[0, 0], comment, UniformBlocks(generator(seed, "reference")), progress)
+
+    ## periodic over 2*radius in x and y, as in the loop
+    pos = np.zeros([sum(counts),3],float)
+    labels = speciesLabels(counts, generator(seed, "species"))
+    placeAtoms(pos, (2*radius, 2*radius, height), cutoffs, labels=labels, sampler=cylinderSampler((height/2, height/2), radius, height), progress=progress,
+               rng=generator(seed, "cell-list"))
+    counts = _speciesBlocks(pos, labels, len(species))
+    return Model(comment, 1.0, (radius + vacuum, radius + vacuum, height), species, counts, pos/height)
+
+
+def _carbonNanotubeLoop(num_atoms, radius, height, vacuum, cutoff, comment, ran, progress=None):
+    box = height
+
+    def isInCylinder(_x,_y):
+        '''
+        Takes a specified co-ordinate and determine if the points fall within the cylindrical constrains
+        Returns one that works if the answer is FALSE
+        '''
+        center = box/2
+        ## if axis not within circle reject it
+        while (_x - center)**2 + (_y - center)**2  > radius**2:
+            _x = box*ran.random()
+            _y = box*ran.random()
+        return _x,_y
+
+    pos = np.zeros([num_atoms,3],float)   ## A list that takes in the position of the atoms
+
+    ct = 0
+    rnd_xy = lambda i: i - round(i/(2 * radius)) * (2 * radius)
+    rnd_z = lambda i: i-round(i/height)*height  ## This makes rnd a function that takes i and perform i - round(i/box)*box
+    vec_rnd_xy = np.vectorize(rnd_xy)
+    vec_rnd_z = np.vectorize(rnd_z)         ## takes  a function and gives result in a callable vectorised function
+
+    while ct < num_atoms:
+        atoms =[box*ran.random(),box*ran.random(),box*ran.random()]
+        atoms[0],atoms[1] = isInCylinder(atoms[0],atoms[1])
+        test = 0
+
+        while test < ct:
+            atom_distance = atoms-pos[test][:]
+            atom_distance[0] = vec_rnd_xy(atom_distance[0]) # doing for x
+            atom_distance[1] = vec_rnd_xy(atom_distance[1]) # doing for x
+            atom_distance[2] = vec_rnd_z(atom_distance[2])    # doing for z
+
+            ### Position the atoms if atoms are not close to center
+            if sum(map(lambda i: i*i, atom_distance)) < cutoff**2:
+                atoms =np.array([box*ran.random(),box*ran.random(),box*ran.random()])
+                atoms[0],atoms[1] = isInCylinder(atoms[0],atoms[1])
+                test = 0
+            else:
+                test += 1
+
+        pos[ct][:] = atoms
+
+        ct +=1
+        if progress is not None:
+            progress(ct/num_atoms)
+        print (f"Placing Atom number {ct} of {num_atoms}", end='\r')
+
+    return Model(comment, 1.0, (radius + vacuum, radius + vacuum, box), ["C"], [num_atoms], pos/height)
+
+
+def fullerene(composition, radius, vacuum, cutoffs, comment, engine="cell-list", seed=None, progress=None):
+    '''
+    Distributes the atoms randomly in a sphere of the given radius, centered in a box with vacuum
+    '''
+    species, counts, cutoffs = _composition(composition, cutoffs, engine)
+    seed, comment = _seed(seed, comment, engine)
+    if engine == "reference":
+        return _fullereneLoop(counts[0], radius, vacuum, cutoffs[0, 0], comment, UniformBlocks(generator(seed, "reference")), progress)
+
+    ## periodic over 2*radius, as in the loop
+    big_box = 2*radius + vacuum
+    pos = np.zeros([sum(counts),3],float)
+    labels = speciesLabels(counts, generator(seed, "species"))
+    placeAtoms(pos, 2*radius, cutoffs, labels=labels, sampler=sphereSampler((big_box/2, big_box/2, big_box/2), radius), progress=progress,
+               rng=generator(seed, "cell-list"))
+    counts = _speciesBlocks(pos, labels, len(species))
+    return Model(comment, 1.0, (big_box, big_box, big_box), species, counts, pos/big_box)
+
+
+def _fullereneLoop(num_atoms, radius, vacuum, cutoff, comment, ran, progress=None):
+    box = radius
+    big_box = 2*radius + vacuum
+
+    def isInSphere(_x,_y,_z):
+        '''
+        Takes a specified co-ordinate and determine if the points fall within the spherical constrains
+        Returns one that works if the answer is FALSE
+        '''
+        center = big_box/2
+        ## if axis not within circle reject it
+        while (_x - center)**2 + (_y - center)**2 + (_z- center)**2 > radius**2:
+            _x = big_box*ran.random()
+            _y = big_box*ran.random()
+            _z = big_box*ran.random()
+        return _x,_y,_z
+
+    pos = np.zeros([num_atoms,3],float)   ## A list that takes in the position of the atoms
+
+    ct = 0
+    rnd = lambda i: i - round(i/(2 * radius)) * (2 * radius)
+    vec_rnd = np.vectorize(rnd)         ## takes  a function and gives result in a callable vectorised function
+
+    while ct < num_atoms:
+        atoms =[box*ran.random(),box*ran.random(),box*ran.random()]
+        atoms[0],atoms[1], atoms[2] = isInSphere(atoms[0],atoms[1],atoms[2])
+        test = 0
+
+        while test < ct:
+            atom_distance = atoms-pos[test][:]
+            atom_distance = vec_rnd(atom_distance)
+
+            ### Position the atoms if atoms are not close to center
+            if sum(map(lambda i: i*i, atom_distance)) < cutoff**2:
+                atoms =np.array([box*ran.random(),box*ran.random(),box*ran.random()])
+                atoms[0],atoms[1], atoms[2] = isInSphere(atoms[0],atoms[1],atoms[2])
+                test = 0
+            else:
+                test += 1
+
+        pos[ct][:] = atoms
+
+        ct +=1
+        if progress is not None:
+            progress(ct/num_atoms)
+        print (f"Placing Atom number {ct} of {num_atoms}", end='\r')
+
+    return Model(comment, 1.0, (big_box, big_box, big_box), ["C"], [num_atoms], pos/big_box)
+
+
+##################### Incremental extension ##################################################################################
+
+def _grownBox(model, box):
+    '''
+    Checks that an existing cubic model can be grown to the new box length, returns the scaling factor
+    '''
+    old_box = model.box
+    if np.ptp(old_box) > 1e-6 * old_box[0]:
+        raise ValueError("Only cubic models can be extended.")
+    if box < old_box[0] * (1 - 1e-9):
+        raise ValueError(f"The new box ({box:.2f} Å) is smaller than the model's ({old_box[0]:.2f} Å). "
+                         "Extending can add atoms or lower the density, not squeeze the existing atoms together.")
+    return box / old_box[0]
+
+
+def extendAmorphousGraphite(model, composition, box, cutoffs, comment, seed=None, progress=None, layers=None):
+    '''
+    Adds atoms to an existing amorphous graphite model instead of starting again from zero
+
+    The existing atoms keep their fractional coordinates while the box grows to the new box length
+    (so the density stays on target and no two atoms get closer), then only the missing atoms are placed.
+    layers seeds the new atoms in a stack of planes, as in amorphousGraphite.
+    '''
+    species, counts, cutoffs = _composition(composition, cutoffs)
+    seed, comment = _seed(seed, comment)
+    labels = _extensionLabels(species, counts, _modelLabels(model, species), generator(seed, "extend species", model.num_atoms))
+    _grownBox(model, box)
+
+    pos = np.zeros([sum(counts),3],float)
+    pos[:model.num_atoms] = (model.frac % 1.0) * box
+    sampler = None if layers is None else layeredSampler(box, *layers)
+    placeAtoms(pos, box, cutoffs, start=model.num_atoms, labels=labels, progress=progress, rng=generator(seed, "extend cell-list", model.num_atoms),
+               sampler=sampler)
+    counts = _speciesBlocks(pos, labels, len(species))
+
+    return Model(comment, box, (1.0, 1.0, 1.0), species, counts, pos/box)
+
+
+def extendPorousCarbon(model, composition, box, cutoffs, pore_overlap, new_pore_radii, comment, seed=None, progress=None):
+    '''
+    Adds atoms and/or pores to an existing porous carbon model
+
+    The box grows to the new box length with the pore radii scaled along, so the porosity is unchanged.
+    New pores are placed with the same overlap rule as the original pores; atoms that end up inside
+    a new pore are removed and placed again elsewhere, together with any extra atoms requested.
+    New atoms are kept out of every pore. The pores of an uploaded POSCAR are sized by porosity.modelPores.
+    Draw new_pore_radii with porosity.extensionPoreRadii, so the new pores stay within the porosity.
+    '''
+    if model.species[0] != "O":
+        raise ValueError("Only porous carbon models, with the pore centers written as O ahead of the atoms, can be extended here.")
+    species, counts, cutoffs = _composition(composition, cutoffs)
+    if "O" in species:
+        raise ValueError("Oxygen marks the pores of porous carbon models and cannot be used as a dopant.")
+    seed, comment = _seed(seed, comment)
+    old_pores = model.counts[0]
+    existing = _modelLabels(model, species, skip=1)
+    _missingAtoms(species, counts, existing)   # fails early if the model already has too many atoms
+    s = _grownBox(model, box)
+
+    frac = model.frac % 1.0
+    pore_centers = frac[:old_pores] * box
+    poreRadii_list = modelPores(model)[1] * s
+    atoms = frac[old_pores:] * box
+
+    ## new pores, same rule as the original pore loop: the first of the candidates (drawn 64 at a time)
+    ## that keeps its distance to every pore placed so far
+    rng = generator(seed, "extend pores", model.num_atoms)
+    for radius in new_pore_radii:
+        free = np.zeros(1, dtype=bool)
+        while not free.any():
+            centers = rng.random((64, 3)) * box
+            pore_distance = minimumImage(centers[:, None, :] - pore_centers[None, :, :], box)
+            free = ~np.any(np.sum(pore_distance**2, axis=2) < (pore_overlap * poreRadii_list)**2, axis=1)
+        center = centers[np.argmax(free)]
+        pore_centers = np.vstack([pore_centers, center])
+        poreRadii_list = np.append(poreRadii_list, radius)
+
+    ## atoms now inside a new pore have to go
+    if len(new_pore_radii):
+        atom_distance = atoms[:, None, :] - pore_centers[None, old_pores:, :]
+        atom_distance -= np.round(atom_distance / box) * box
+        keep = ~np.any(np.sum(atom_distance**2, axis=2) < poreRadii_list[old_pores:]**2, axis=1)
+        atoms, existing = atoms[keep], existing[keep]
+    labels = _extensionLabels(species, counts, existing, generator(seed, "extend species", model.num_atoms))
+
+    num_pores = len(pore_centers)
+    pos = np.zeros([num_pores+sum(counts),3],float)
+    pos[:num_pores] = pore_centers
+    pos[num_pores:num_pores+len(atoms)] = atoms
+    placeAtoms(pos[num_pores:], box, cutoffs, pore_centers=pore_centers, pore_radii=poreRadii_list, start=len(atoms), labels=labels, progress=progress,
+               rng=generator(seed, "extend cell-list", model.num_atoms))
+    counts = _speciesBlocks(pos[num_pores:], labels, len(species))
+
+    return Model(comment, box, (1.0, 1.0, 1.0), ["O"] + species, [num_pores] + counts, pos/box, extras={"pore_radii": poreRadii_list})
@@ -0,0 +1,231 @@
+import numpy as np
+from mtg.porosity import modelPores
+
+### Pore connectivity and accessible surface of porous carbon models
+###
+### The pore space is voxelised on a periodic grid x grid x grid mesh. A probe sphere of radius probe can put its
+### center where it fits entirely in the void: the void eroded by the probe (an FFT convolution with the probe ball,
+### which is periodic for free). The connected clusters of those centers come from a union-find over the grid, and a
+### cluster percolates along an axis when it wraps around the periodic box in that direction. Rolling the probe over
+### the walls (the eroded void dilated again) gives the void it can reach, and the area of its walls.
+
+
+def voidGrid(centers, radii, box, grid=128):
+    '''
+    Boolean grid, true where the voxel center is inside at least one of the periodic spherical pores
+    '''
+    box = np.broadcast_to(np.asarray(box, dtype=np.float64), (3,))
+    h = box / grid
+    void = np.zeros((grid, grid, grid), dtype=bool)
+    for center, radius in zip(np.asarray(centers, dtype=np.float64).reshape(-1, 3), radii):
+        ## the pore is separable into squared distances along each axis over its bounding box
+        axes, d2 = [], []
+        for k in range(3):
+            lo, hi = np.ceil((center[k] - radius) / h[k] - 0.5), np.floor((center[k] + radius) / h[k] - 0.5)
+            i = np.arange(grid) if hi - lo + 1 >= grid else np.arange(lo, hi + 1).astype(np.int64)
+            d = (i + 0.5) * h[k] - center[k]
+            d -= np.round(d / box[k]) * box[k]
+            axes.append(i % grid)
+            d2.append((d**2).astype(np.float32))
+        inside = d2[0][:, None, None] + d2[1][None, :, None] + d2[2][None, None, :] < np.float32(radius**2)
+        void[np.ix_(*axes)] |= inside
+    return void
+
+
+def _ballSpectrum(shape, h, radius):
+    '''
+    Fourier transform of the periodic indicator of a ball of the given radius around voxel 0
+    '''
+    offsets = [np.fft.fftfreq(n, 1.0 / n) * h[k] for k, n in enumerate(shape)]
+    r2 = offsets[0][:, None, None]**2 + offsets[1][None, :, None]**2 + offsets[2][None, None, :]**2
+    return np.fft.rfftn((r2 <= radius**2).astype(np.float32), axes=(0, 1, 2))
+
+
+def _convolve(mask, spectrum):
+    return np.fft.irfftn(np.fft.rfftn(mask.astype(np.float32), axes=(0, 1, 2)) * spectrum, s=mask.shape, axes=(0, 1, 2))
+
+
+def probeAccessible(void, box, probe):
+    '''
+    Where a probe of radius probe can put its center (the void eroded by the probe) and the void it can reach (dilated back)
+    '''
+    h = np.broadcast_to(np.asarray(box, dtype=np.float64), (3,)) / np.array(void.shape)
+    if probe < 0.5 * h.min():
+        return void, void
+    spectrum = _ballSpectrum(void.shape, h, probe)
+    ## counts are integers, so 0.5 separates zero from non-zero despite the float32 round-off
+    centers = _convolve(~void, spectrum) < 0.5
+    return centers, _convolve(centers, spectrum) > 0.5
+
+
+def _roots(parent, nodes):
+    '''
+    Root of the tree of each of the nodes, compressing only their paths
+    '''
+    root = parent[nodes]
+    while True:
+        up = parent[root]
+        if np.array_equal(up, root):
+            break
+        root = up
+    parent[nodes] = root
+    return root
+
+
+def _unionFind(num_nodes, a, b):
+    '''
+    Root (smallest node) of the tree of every node, for the undirected edges a-b.
+    Each round hooks the larger root of every edge onto the smallest root it meets; the edges between the roots are
+    left for the next round. Only the paths of the touched nodes are compressed until the end.
+    '''
+    parent = np.arange(num_nodes)
+    while len(a):
+        ra, rb = _roots(parent, a), _roots(parent, b)
+        apart = ra != rb
+        lo, hi = np.minimum(ra[apart], rb[apart]), np.maximum(ra[apart], rb[apart])
+        np.minimum.at(parent, hi, lo)
+        a, b = _uniquePairs(lo, hi, num_nodes)
+    return _roots(parent, np.arange(num_nodes))
+
+
+def _uniquePairs(a, b, num_nodes):
+    pairs = np.sort(a * num_nodes + b)
+    first = np.ones(len(pairs), dtype=bool)
+    first[1:] = pairs[1:] != pairs[:-1]
+    pairs = pairs[first]
+    return pairs // num_nodes, pairs % num_nodes
+
+
+def _runs(mask):
+    '''
+    Run of every voxel of the mask along the last axis (not across the box face), numbered in memory order.
+    Returns the run of each voxel of the grid (-1 outside the mask) and the number of runs.
+    '''
+    flat = mask.reshape(-1, mask.shape[-1])
+    starts = flat.copy()
+    starts[:, 1:] &= ~flat[:, :-1]
+    run = np.cumsum(starts.ravel(), dtype=np.int64) - 1
+    return np.where(mask.ravel(), run, -1).reshape(mask.shape), int(run[-1]) + 1 if run.size else 0
+
+
+def labelClusters(mask):
+    '''
+    6-connected clusters of a periodic boolean grid
+
+    Returns the cluster of every voxel (-1 outside the mask), the number of voxels of each cluster, and whether each
+    cluster wraps around the box along x, y and z (i.e. percolates). The voxels are first joined into runs along z;
+    a union-find over the bonds between the runs gives the clusters of the open grid. The bonds across the box faces
+    then join those, keeping track of how often a path crosses each face, and a cluster wraps along an axis when it
+    reaches itself with a different crossing count.
+    '''
+    run, num_runs = _runs(mask)
+
+    inner, seams = [], []
+    for k in range(3):
+        for pairs, first, second in ((inner, slice(0, -1), slice(1, None)), (seams, slice(-1, None), slice(0, 1))):
+            if pairs is inner and k == 2:
+                continue   # inside a run
+            a = run[(slice(None),) * k + (first,)]
+            b = run[(slice(None),) * k + (second,)]
+            both = (a >= 0) & (b >= 0)
+            if pairs is inner:
+                ## two runs overlap once: keep only the bond where the overlap starts
+                both[..., 1:] &= (a[..., 1:] != a[..., :-1]) | (b[..., 1:] != b[..., :-1]) | ~both[..., :-1]
+            pairs.append((a[both], b[both]))
+    root = _unionFind(num_runs, np.concatenate([a for a, _ in inner]), np.concatenate([b for _, b in inner]))
+    roots, open_cluster = np.unique(root, return_inverse=True)
+
+    ## bonds across the faces between the open clusters, each crossing the face of its axis once in the + direction
+    adjacency = {}
+    for k, (a, b) in enumerate(seams):
+        step = tuple(int(k == j) for j in range(3))
+        for u, v in np.unique(np.stack([open_cluster[a], open_cluster[b]], axis=1), axis=0):
+            adjacency.setdefault(int(u), []).append((int(v), step))
+            adjacency.setdefault(int(v), []).append((int(u), tuple(-s for s in step)))
+
+    cluster = np.arange(len(roots))
+    wraps = []
+    crossings = {}
+    for start in adjacency:
+        if start in crossings:
+            continue
+        cluster_id = len(wraps)
+        wrap = np.zeros(3, dtype=bool)
+        crossings[start] = (0, 0, 0)
+        stack = [start]
+        while stack:
+            u = stack.pop()
+            cluster[u] = cluster_id
+            for v, step in adjacency[u]:
+                expected = tuple(c + s for c, s in zip(crossings[u], step))
+                if v not in crossings:
+                    crossings[v] = expected
+                    stack.append(v)
+                else:
+                    wrap |= np.array(expected) != np.array(crossings[v])
+        wraps.append(wrap)
+    ## open clusters that touch no face bond are clusters of their own
+    alone = np.array([u not in crossings for u in range(len(roots))], dtype=bool)
+    cluster[alone] = len(wraps) + np.arange(np.count_nonzero(alone))
+    wraps = np.array(wraps + [np.zeros(3, dtype=bool)] * int(np.count_nonzero(alone)), dtype=bool).reshape(-1, 3)
+
+    labels = np.where(run >= 0, cluster[open_cluster][run], -1).astype(np.int32)
+    sizes = np.bincount(labels[run >= 0], minlength=len(wraps))
+    return labels, sizes, wraps
+
+
+def surfaceArea(mask, box):
+    '''
+    Area of the boundary of a periodic boolean grid [A^2]
+
+    Counts the voxel faces between the mask and the rest. A staircase has 3/2 times the area of the smooth surface it
+    follows, on average over orientations, so the face area is scaled by 2/3.
+    '''
+    h = np.broadcast_to(np.asarray(box, dtype=np.float64), (3,)) / np.array(mask.shape)
+    face = np.array([h[1] * h[2], h[0] * h[2], h[0] * h[1]])
+    faces = [np.count_nonzero(mask != np.roll(mask, 1, axis=k)) for k in range(3)]
+    return 2/3 * float(np.dot(faces, face))
+
+
+def poreConnectivity(centers, radii, box, grid=128, probe=0.0, progress=None):
+    '''
+    Connectivity of the void left by periodic spherical pores, for a probe of radius probe [A]
+
+    Returns a dict with
+        void_fraction           fraction of the box inside the pores
+        accessible_fraction     fraction of the box the probe can reach
+        cluster_volumes         volume of each connected cluster of probe centers [A^3], largest first
+                                (the void volume of each pore cluster without a probe)
+        percolates              (x, y, z) whether some cluster wraps around the box along that axis
+        percolating_fraction    share of the probe centers in clusters that percolate along any axis
+        surface_area            area of all pore walls [A^2]
+        accessible_area         area of the walls the probe touches when rolled through the pores [A^2]
+
+    progress, if given, is called with the fraction done after each stage.
+    '''
+    box = np.broadcast_to(np.asarray(box, dtype=np.float64), (3,))
+    void = voidGrid(centers, radii, box, grid)
+    centers_grid, reachable = probeAccessible(void, box, probe)
+    if progress is not None:
+        progress(0.5)
+    labels, sizes, wraps = labelClusters(centers_grid)
+    if progress is not None:
+        progress(0.9)
+
+    volume = np.prod(box)
+    cluster_volumes = sizes * volume / grid**3
+    order = np.argsort(cluster_volumes)[::-1]
+    percolating = wraps.any(axis=1)
+
+    return {"void_fraction": np.count_nonzero(void) / void.size, "accessible_fraction": np.count_nonzero(reachable) / void.size,
+            "cluster_volumes": cluster_volumes[order], "percolates": wraps.any(axis=0),
+            "percolating_fraction": float(sizes[percolating].sum() / max(sizes.sum(), 1)),
+            "surface_area": surfaceArea(void, box), "accessible_area": surfaceArea(reachable, box)}
+
+
+def modelConnectivity(model, grid=128, probe=0.0, progress=None):
+    '''
+    poreConnectivity of the pores of a porous carbon model (see porosity.modelPores), like porosity.modelPorosity
+    '''
+    centers, radii = modelPores(model)
+    return poreConnectivity(centers, radii, model.box, grid, probe, progress)
@@ -0,0 +1,228 @@
+import argparse
+import contextlib
+import io
+import sys
+import time
+import numpy as np
+from mtg import builders
+from mtg.placement import minimumImage
+from mtg.species import atomMassGram
+
+### Statistical equivalence of placement engines
+###
+### Generates matched ensembles (same inputs, independent random draws) with two engines and compares
+### the distributions that matter to the simulations started from the models: nearest-neighbour distances,
+### the radial distribution function, how evenly the atoms fill the space, and that no atom sits closer
+### than the cutoff or inside an excluded pore.
+###
+###     python -m mtg.equivalence amorphous --models 10 --atoms 300
+###
+### exits with status 1 when a comparison is outside its tolerance.
+
+KS_ALPHA = 0.001      # significance level of the two-sample Kolmogorov-Smirnov tests
+NN_MEAN_TOL = 0.02    # relative difference allowed between the mean nearest-neighbour distances
+RDF_TOL = 0.08        # normalised L1 distance allowed between the two g(r)
+RDF_BINS = 60
+
+
+class Case:
+    '''
+    One constructor with fixed inputs
+
+    build(engine, seed) generates a model, atoms(model) returns the atom positions in angstrom (pores left out),
+    period is the periodic box the engines use, and pores(model) the (centers, radii) atoms must stay out of.
+    '''
+
+    def __init__(self, name, build, atoms, period, cutoff, pores=None):
+        self.name = name
+        self.build = build
+        self.atoms = atoms
+        self.period = np.broadcast_to(np.asarray(period, dtype=np.float64), (3,))
+        self.cutoff = cutoff
+        self.pores = pores
+
+
+def _totalMass(num_atoms):
+    return atomMassGram(["C"])[0] * num_atoms
+
+
+def amorphousCase(num_atoms=300, density=2.44, cutoff=1.2):
+    box = (_totalMass(num_atoms) / density)**(1/3) / 1e-8
+    return Case("amorphous", lambda engine, seed: builders.amorphousGraphite({"C": num_atoms}, box, cutoff, "equivalence", engine=engine, seed=seed),
+                lambda model: model.frac * box, box, cutoff)
+
+
+def porousCase(num_atoms=300, density=1.0, num_pores=3, porosity=0.1, cutoff=1.2):
+    box = (_totalMass(num_atoms) / density)**(1/3) / 1e-8
+    ## equal pores, with the pages' porosity rule (radius**3 / box**3 per pore)
+    radii = np.full(num_pores, (porosity / num_pores)**(1/3) * box)
+
+    def build(engine, seed):
+        return builders.porousCarbon({"C": num_atoms}, num_pores, box, cutoff, 0.3, radii, "equivalence", engine=engine, seed=seed)
+
+    ## both engines keep the atoms out of every pore
+    return Case("porous", build, lambda model: model.frac[num_pores:] * box, box, cutoff,
+                pores=lambda model: (model.frac[:num_pores] * box, radii))
+
+
+def nanotubeCase(num_atoms=300, aspect_ratio=1.3, density=1.7, vacuum=6.0, cutoff=1.2):
+    radius = (_totalMass(num_atoms) / (density * aspect_ratio * 2*np.pi))**(1/3) * 1e8
+    height = 2*radius * aspect_ratio
+    return Case("nanotube", lambda engine, seed: builders.carbonNanotube({"C": num_atoms}, radius, height, vacuum, cutoff, "equivalence", engine=engine, seed=seed),
+                lambda model: model.frac * height, (2*radius, 2*radius, height), cutoff)
+
+
+def fullereneCase(num_atoms=300, density=2.26, vacuum=6.0, cutoff=1.2):
+    radius = np.cbrt(3 * _totalMass(num_atoms) / density / (4*np.pi)) / 1e-8
+    big_box = 2*radius + vacuum
+    return Case("fullerene", lambda engine, seed: builders.fullerene({"C": num_atoms}, radius, vacuum, cutoff, "equivalence", engine=engine, seed=seed),
+                lambda model: model.frac * big_box, 2*radius, cutoff)
+
+
+CASES = {"amorphous": amorphousCase, "porous": porousCase, "nanotube": nanotubeCase, "fullerene": fullereneCase}
+
+
+##################### Statistics #############################################################################################
+
+def pairDistances(pos, period):
+    '''
+    Periodic (minimum image) distances between all pairs of atoms, shape (n, n), inf on the diagonal
+    '''
+    pos = np.asarray(pos, dtype=np.float64)
+    r = np.sqrt(np.sum(minimumImage(pos[:, None, :] - pos[None, :, :], period)**2, axis=2))
+    np.fill_diagonal(r, np.inf)
+    return r
+
+
+def radialDistribution(r, period, r_max, bins=RDF_BINS):
+    '''
+    g(r) from a pair distance matrix, normalised by the mean number density of the periodic box
+    '''
+    n = len(r)
+    edges = np.linspace(0, r_max, bins + 1)
+    counts, _ = np.histogram(r[np.triu_indices(n, k=1)], bins=edges)
+    shell = 4/3 * np.pi * (edges[1:]**3 - edges[:-1]**3)
+    ideal = shell * n / np.prod(period) * n / 2
+    return counts / ideal, edges
+
+
+def modelStatistics(case, model, r_max):
+    pos = np.asarray(case.atoms(model), dtype=np.float64)
+    r = pairDistances(pos, case.period)
+    g, _ = radialDistribution(r, case.period, r_max)
+
+    ## distance of every atom to the nearest pore surface (negative inside a pore)
+    surface = np.zeros(0)
+    if case.pores is not None:
+        centers, radii = case.pores(model)
+        d = minimumImage(pos[:, None, :] - np.asarray(centers, dtype=np.float64)[None, :, :], case.period)
+        surface = np.min(np.sqrt(np.sum(d**2, axis=2)) - np.asarray(radii)[None, :], axis=1)
+
+    ## nearest-neighbour distances, once per pair: two atoms that are each other's nearest neighbour share one distance,
+    ## and counting it twice would make the KS test see more independent samples than there are
+    nearest = np.argmin(r, axis=1)
+    pairs = np.unique(np.sort(np.stack([np.arange(len(r)), nearest], axis=1), axis=1), axis=0)
+
+    return {"nn": r[pairs[:, 0], pairs[:, 1]], "rdf": g, "coords": pos % case.period / case.period, "surface": surface,
+            "too_close": int(np.sum(np.triu(r < case.cutoff * (1 - 1e-6), k=1))), "in_pores": int(np.sum(surface < 0))}
+
+
+def ensemble(case, engine, num_models, r_max, seed=0):
+    '''
+    Statistics of num_models independent models from one engine, pooled. Also returns the mean time per model.
+
+    Model i is built with seed + i. Pores and atoms come from different streams of the seed, and every engine
+    has its own atom stream, so with the same seed two engines get the same pore layouts and only the atoms differ.
+    '''
+    stats = []
+    start = time.perf_counter()
+    for i in range(num_models):
+        with contextlib.redirect_stdout(io.StringIO()):   # the reference loops print every atom
+            model = case.build(engine, seed + i)
+        stats.append(modelStatistics(case, model, r_max))
+    seconds = (time.perf_counter() - start) / num_models
+
+    return {"nn": np.concatenate([s["nn"] for s in stats]),
+            "rdf": np.mean([s["rdf"] for s in stats], axis=0),
+            "coords": np.concatenate([s["coords"] for s in stats]),
+            "surface": np.concatenate([s["surface"] for s in stats]),
+            "too_close": sum(s["too_close"] for s in stats),
+            "in_pores": sum(s["in_pores"] for s in stats),
+            "seconds": seconds}
+
+
+def ksStatistic(a, b):
+    '''
+    Two-sample Kolmogorov-Smirnov statistic D and the critical value at KS_ALPHA
+    '''
+    a, b = np.sort(a), np.sort(b)
+    x = np.concatenate([a, b])
+    d = np.max(np.abs(np.searchsorted(a, x, side="right") / len(a) - np.searchsorted(b, x, side="right") / len(b)))
+    c = np.sqrt(-0.5 * np.log(KS_ALPHA / 2))
+    return d, c * np.sqrt((len(a) + len(b)) / (len(a) * len(b)))
+
+
+def compareEnsembles(a, b, r_max):
+    '''
+    Rows of (check, value, tolerance, passed) comparing ensemble statistics a (candidate) and b (reference)
+    '''
+    rows = []
+    d, crit = ksStatistic(a["nn"], b["nn"])
+    rows.append(("nearest-neighbour distance KS D", d, crit, d <= crit))
+    rel = abs(a["nn"].mean() - b["nn"].mean()) / b["nn"].mean()
+    rows.append(("mean nearest-neighbour distance rel. diff.", rel, NN_MEAN_TOL, rel <= NN_MEAN_TOL))
+
+    dr = r_max / len(a["rdf"])
+    l1 = np.sum(np.abs(a["rdf"] - b["rdf"])) * dr / max(np.sum(b["rdf"]) * dr, 1e-12)
+    rows.append(("g(r) normalised L1 distance", l1, RDF_TOL, l1 <= RDF_TOL))
+
+    for axis, name in enumerate("xyz"):
+        d, crit = ksStatistic(a["coords"][:, axis], b["coords"][:, axis])
+        rows.append((f"spatial uniformity along {name} KS D", d, crit, d <= crit))
+    if len(b["surface"]):
+        d, crit = ksStatistic(a["surface"], b["surface"])
+        rows.append(("distance to the nearest pore surface KS D", d, crit, d <= crit))
+
+    for stats, engine in ((a, "candidate"), (b, "reference")):
+        rows.append((f"pairs closer than the cutoff ({engine})", stats["too_close"], 0, stats["too_close"] == 0))
+        rows.append((f"atoms inside excluded pores ({engine})", stats["in_pores"], 0, stats["in_pores"] == 0))
+    return rows
+
+
+def checkEquivalence(case, engine="cell-list", reference="reference", num_models=10, seed=0):
+    '''
+    Builds matched ensembles with both engines and compares them. Returns the comparison rows and the two ensembles.
+    '''
+    r_max = min(case.period) / 2
+    a = ensemble(case, engine, num_models, r_max, seed)
+    b = ensemble(case, reference, num_models, r_max, seed)
+    return compareEnsembles(a, b, r_max), a, b
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mtg.equivalence", description="Checks that a placement engine builds models statistically like the reference engine.")
+    parser.add_argument("cases", nargs="*", metavar="case", help=f"constructors to check: {', '.join(CASES)} (default: all)")
+    parser.add_argument("--engine", default="cell-list", choices=builders.ENGINES, help="engine to check")
+    parser.add_argument("--reference", default="reference", choices=builders.ENGINES, help="engine to compare against")
+    parser.add_argument("--models", type=int, default=10, help="models per ensemble")
+    parser.add_argument("--atoms", type=int, default=300, help="atoms per model")
+    parser.add_argument("--cutoff", type=float, default=1.2, help="C-C cutoff in angstrom")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the pore layouts shared by both ensembles")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.cases if name not in CASES]
+    if unknown:
+        parser.error(f"unknown case {', '.join(unknown)}, choose from {', '.join(CASES)}")
+
+    failed = False
+    for name in args.cases or list(CASES):
+        case = CASES[name](num_atoms=args.atoms, cutoff=args.cutoff)
+        rows, a, b = checkEquivalence(case, args.engine, args.reference, args.models, args.seed)
+        print(f"\n{name}: {args.models} models of {args.atoms} atoms, {args.engine} {a['seconds']:.2f} s/model, {args.reference} {b['seconds']:.2f} s/model")
+        for check, value, tol, passed in rows:
+            print(f"  {'ok  ' if passed else 'FAIL'}  {check:<45} {value:10.4g}   (tolerance {tol:.4g})")
+            failed |= not passed
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
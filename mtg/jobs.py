@@ -0,0 +1,229 @@
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import types
+import uuid
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+## Defaults for the process-wide scheduler shared by every session of the app
+MAX_WORKERS = max(1, (os.cpu_count() or 1) - 1)   # worker processes generating models, one core is left to the server
+MAX_QUEUED = 32                                   # jobs waiting for a worker, server wide
+MAX_JOBS_PER_USER = 2                             # queued + running jobs of one user (signed-in user or browser session)
+JOB_RESULT_TTL = 3600                             # seconds a finished job waits to be collected
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+class UserLimitReached(RuntimeError):
+    pass
+
+
+##################### Worker side ############################################################################################
+
+_PROGRESS = None   # shared array of doubles, one slot per worker
+
+
+def _initWorker(progress):
+    global _PROGRESS
+    _PROGRESS = progress
+
+
+def _runJob(slot, fn, args, kwargs):
+    def progress(fraction):
+        _PROGRESS[slot] = fraction
+    _PROGRESS[slot] = 0.0
+    return fn(*args, progress=progress, **kwargs)
+
+
+@contextmanager
+def _plainMain():
+    '''
+    While a Streamlit page runs, sys.modules["__main__"] is the page script, and spawned workers would
+    import (i.e. run) it. Worker processes are started with an empty __main__ instead.
+    '''
+    main = sys.modules.get("__main__")
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+##################### Server side ############################################################################################
+
+class Job:
+    def __init__(self, user, fn, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.user = user
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.state = "queued"   # queued -> running -> done / failed, or running -> cancelled until the worker is free
+        self.slot = None
+        self.future = None
+        self.finished_at = None
+
+
+class JobScheduler:
+    '''
+    Runs CPU-bound generation in a pool of worker processes, shared by all sessions
+
+    The pure-Python placement loops hold the GIL, so running them in the Streamlit script thread
+    stalls every other session of the server. Jobs submitted here run in separate processes instead.
+    At most max_workers jobs run at once, at most max_queued wait behind them and one user can have
+    at most max_per_user jobs queued or running. submit() raises QueueFull / UserLimitReached otherwise.
+    A cancelled job that is already running keeps its worker until it finishes, so it still counts
+    against its user until then.
+
+    The job function must be importable (module level) and accept a ``progress`` keyword,
+    a callable that it calls with the fraction done. status() reports it back.
+    '''
+
+    def __init__(self, max_workers=MAX_WORKERS, max_queued=MAX_QUEUED, max_per_user=MAX_JOBS_PER_USER):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self._jobs = OrderedDict()
+        self._queue = deque()
+        self._free_slots = list(range(max_workers))
+        self._lock = threading.RLock()
+        self._executor = None
+        self._ctx = multiprocessing.get_context("spawn")   # never fork the threaded server process
+        self._progress = self._ctx.Array("d", max_workers, lock=False)
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.max_workers, mp_context=self._ctx, initializer=_initWorker, initargs=(self._progress,))
+        return self._executor
+
+    def submit(self, user, fn, *args, replaces=None, **kwargs):
+        '''
+        Queues fn(*args, **kwargs) for user. replaces is the id of a job this one supersedes (e.g. the page's last job):
+        it is left out of the limits and cancelled once the new job is accepted. When the new job is refused, it stays.
+        '''
+        with self._lock:
+            self._cleanup()
+            old = self._jobs.get(replaces)
+            active = sum(1 for job in self._jobs.values() if job.user == user and job.state in ("queued", "running", "cancelled") and job is not old)
+            if active >= self.max_per_user:
+                raise UserLimitReached(f"You already have {active} models being generated, please wait for them to finish.")
+            if len(self._queue) - (old is not None and old.state == "queued") >= self.max_queued:
+                raise QueueFull("The server is busy, please try again in a few minutes.")
+
+            job = Job(user, fn, args, kwargs)
+            self._jobs[job.id] = job
+            self._queue.append(job)
+            if old is not None:
+                self.cancel(old.id)
+            self._dispatch()
+            return job.id
+
+    def status(self, job_id):
+        '''
+        Returns (state, detail): ("queued", position in the queue starting at 1), ("running", fraction done),
+        ("done", None), ("failed", error message) or ("unknown", None) for an unknown, collected or cancelled job
+        '''
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state == "cancelled":
+                return "unknown", None
+            if job.state == "queued":
+                return "queued", self._queue.index(job) + 1
+            if job.state == "running":
+                return "running", self._progress[job.slot]
+            if job.state == "failed":
+                return "failed", str(job.future.exception())
+            return "done", None
+
+    def result(self, job_id):
+        '''
+        Collects the result of a finished job (re-raising its exception if it failed) and forgets the job
+        '''
+        with self._lock:
+            job = self._jobs.pop(job_id)
+        return job.future.result()
+
+    def cancel(self, job_id):
+        '''
+        Forgets a job. A queued job is never started. A running job cannot be stopped: it stays on its worker
+        (and counts against its user) as "cancelled" until it finishes, then its result is released.
+        '''
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if job.state == "running":
+                job.state = "cancelled"
+                return
+            del self._jobs[job_id]
+            if job.state == "queued":
+                self._queue.remove(job)
+            else:
+                _releaseResult(job)
+
+    def _dispatch(self):
+        while self._queue and self._free_slots:
+            job = self._queue.popleft()
+            job.slot = self._free_slots.pop()
+            job.state = "running"
+            self._progress[job.slot] = 0.0
+            with _plainMain():
+                try:
+                    job.future = self._pool().submit(_runJob, job.slot, job.fn, job.args, job.kwargs)
+                except BrokenProcessPool:
+                    self._executor = None
+                    job.future = self._pool().submit(_runJob, job.slot, job.fn, job.args, job.kwargs)
+            job.future.add_done_callback(lambda future, job=job: self._finished(job))
+
+    def _finished(self, job):
+        with self._lock:
+            if job.state == "cancelled":
+                self._jobs.pop(job.id, None)
+                _releaseResult(job)
+            else:
+                job.state = "failed" if job.future.exception() is not None else "done"
+                job.finished_at = time.monotonic()
+            if isinstance(job.future.exception(), BrokenProcessPool):
+                self._executor = None
+            self._free_slots.append(job.slot)
+            self._dispatch()
+
+    def _cleanup(self):
+        ## drop finished jobs nobody came back for
+        now = time.monotonic()
+        for job_id in [job.id for job in self._jobs.values() if job.finished_at is not None and now - job.finished_at > JOB_RESULT_TTL]:
+            _releaseResult(self._jobs.pop(job_id))
+
+
+def _releaseResult(job):
+    '''
+    Releases the result of a finished job nobody will collect (e.g. deletes the file of a mtg.model.PoscarFile)
+    '''
+    if job.future is None or not job.future.done() or job.future.exception() is not None:
+        return
+    release = getattr(job.future.result(), "release", None)
+    if release is not None:
+        release()
+
+
+_SCHEDULER = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def jobScheduler():
+    '''
+    The scheduler shared by all sessions of this server process (created on first use)
+    '''
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = JobScheduler()
+        return _SCHEDULER
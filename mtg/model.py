@@ -0,0 +1,91 @@
+import os
+import numpy as np
+from mtg.poscar import poscarHeader, coordinateChunks, writePoscar, readPoscar
+
+
+class Model:
+    '''
+    A generated structure in compact form
+
+    frac are the "Direct" coordinates as float32, exactly as they go in the POSCAR file,
+    and the remaining fields are what the POSCAR header needs. extras holds any other
+    arrays that belong to the model (e.g. the pore radii of a porous carbon model).
+    The POSCAR text is only produced when it is asked for.
+    '''
+
+    def __init__(self, comment, scale, lattice, species, counts, frac, extras=None):
+        self.comment = comment
+        self.scale = float(scale)
+        self.lattice = tuple(float(x) for x in lattice)
+        self.species = list(species)
+        self.counts = [int(n) for n in counts]
+        self.frac = np.ascontiguousarray(frac, dtype=np.float32)
+        self.extras = {k: np.asarray(v) for k, v in (extras or {}).items()}
+
+    @property
+    def num_atoms(self):
+        return len(self.frac)
+
+    @property
+    def nbytes(self):
+        return self.frac.nbytes + sum(v.nbytes for v in self.extras.values())
+
+    def header(self):
+        return poscarHeader(self.comment, self.scale, self.lattice, self.species, self.counts)
+
+    def poscarText(self, max_atoms=None):
+        '''
+        The POSCAR file as a string. With max_atoms only the first atoms are written (for previews)
+        '''
+        frac = self.frac if max_atoms is None else self.frac[:max_atoms]
+        return self.header() + "".join(coordinateChunks(frac, 1.0))
+
+    def writePoscar(self, path=None):
+        return writePoscar(path, self.header(), self.frac, 1.0)
+
+    @property
+    def box(self):
+        '''
+        The three box lengths in angstrom
+        '''
+        return self.scale * np.array(self.lattice)
+
+    @classmethod
+    def fromPoscar(cls, text):
+        comment, scale, lattice, species, counts, frac = readPoscar(text)
+        return cls(comment, scale, lattice, species, counts, frac)
+
+
+class PoscarFile:
+    '''
+    A model that was written straight to disk (large-model mode)
+
+    Only the path, a short text preview and a small sample of the atoms are kept in memory. nbytes counts that memory,
+    disk_bytes the file. release() deletes the file, the artifact store calls it when the model is evicted.
+    '''
+
+    def __init__(self, path, preview, sample=None):
+        self.path = path
+        self.preview = preview
+        self.sample = sample   # a Model holding a random subset of the atoms, for 3D previews
+        self.disk_bytes = os.path.getsize(path)
+
+    @property
+    def nbytes(self):
+        return self.sample.nbytes if self.sample is not None else 0
+
+    def open(self):
+        '''
+        The POSCAR file opened for binary reading (for downloads)
+        '''
+        return open(self.path, "rb")
+
+    def poscarText(self, max_atoms=None):
+        if max_atoms is not None:
+            return self.preview
+        with open(self.path) as f:
+            return f.read()
+
+    def release(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
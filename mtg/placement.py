@@ -0,0 +1,273 @@
+import os
+import tempfile
+import numpy as np
+
+
+##################### Positions storage ######################################################################################
+
+def positionArray(num_rows, large=False, directory=None):
+    '''
+    Allocates the (num_rows, 3) array that takes in the positions of the atoms (and pores)
+
+    In the default mode this is the usual in-memory float64 array.
+    In large-model mode the positions are float32 and backed by a file on disk (numpy memmap),
+    so a multi-million atom model does not have to fit in RAM next to its output.
+    '''
+    if not large:
+        return np.zeros([num_rows, 3], float)
+
+    fd, path = tempfile.mkstemp(prefix="mtg_positions_", suffix=".f32", dir=directory)
+    os.close(fd)
+    return np.memmap(path, dtype=np.float32, mode="w+", shape=(num_rows, 3))
+
+
+def releasePositions(pos):
+    '''
+    Drops the file behind a large-model position array. Ordinary arrays are left alone.
+    The mapping itself is released when the last reference to the array goes away.
+    '''
+    if isinstance(pos, np.memmap) and pos.filename is not None:
+        try:
+            os.remove(pos.filename)
+        except OSError:
+            pass
+
+
+##################### Spatial index ##########################################################################################
+
+## The 27 neighbouring cells (including the cell itself) of a 3D cell grid
+_NEIGHBOUR_OFFSETS = np.array([[i, j, k] for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)], dtype=np.int64)
+
+
+class CellList:
+    '''
+    Periodic cell list stored as integer arrays
+
+    The box is cut into cells no smaller than the cutoff, so every atom closer than the cutoff
+    to a point sits in one of the 27 cells around that point.
+    Each cell keeps the indices of its atoms in a fixed-width row of ``table`` (-1 marks an empty slot)
+    and ``count`` holds how many slots are used. The row width grows if a cell ever overflows.
+    '''
+
+    def __init__(self, box, cutoff, capacity=4):
+        self.box = np.broadcast_to(np.asarray(box, dtype=np.float64), (3,)).copy()
+        self.n = np.maximum((self.box // cutoff).astype(np.int64), 1)
+        self.cell_len = self.box / self.n
+        num_cells = int(np.prod(self.n))
+        self.count = np.zeros(num_cells, dtype=np.uint8)
+        self.table = np.full((num_cells, capacity), -1, dtype=np.int32)
+
+    def cellCoords(self, xyz):
+        '''
+        Integer (i, j, k) cell of every point in xyz, wrapped into the box
+        '''
+        c = np.floor(np.asarray(xyz) / self.cell_len).astype(np.int64)
+        return c % self.n
+
+    def cellIndex(self, coords):
+        return (coords[..., 0] * self.n[1] + coords[..., 1]) * self.n[2] + coords[..., 2]
+
+    def neighbours(self, xyz):
+        '''
+        Indices of all stored atoms in the 27 cells around every point in xyz, shape (len(xyz), 27*capacity)
+        Empty slots are -1. When the grid has fewer than 3 cells along an axis some cells repeat, which is harmless.
+        '''
+        coords = self.cellCoords(xyz)[:, None, :] + _NEIGHBOUR_OFFSETS[None, :, :]
+        cells = self.cellIndex(coords % self.n)
+        return self.table[cells].reshape(len(xyz), -1)
+
+    def insert(self, indices, xyz):
+        '''
+        Stores atoms with the given indices at positions xyz
+        '''
+        if len(indices) == 0:
+            return
+        cells = self.cellIndex(self.cellCoords(xyz))
+
+        ## rank of each new atom among the new atoms that land in the same cell
+        order = np.argsort(cells, kind="stable")
+        sorted_cells = cells[order]
+        first = np.r_[True, sorted_cells[1:] != sorted_cells[:-1]]
+        group_start = np.maximum.accumulate(np.where(first, np.arange(len(cells)), 0))
+        rank = np.empty(len(cells), dtype=np.int64)
+        rank[order] = np.arange(len(cells)) - group_start
+
+        slots = self.count[cells].astype(np.int64) + rank
+        if slots.max() >= self.table.shape[1]:
+            self._grow(int(slots.max()) + 1)
+
+        self.table[cells, slots] = indices
+        np.add.at(self.count, cells, 1)
+
+    def _grow(self, capacity):
+        capacity = max(capacity, self.table.shape[1] + 2)
+        if capacity > np.iinfo(self.count.dtype).max:
+            raise RuntimeError("Too many atoms in one cell, check the cutoff and the density")
+        table = np.full((self.table.shape[0], capacity), -1, dtype=np.int32)
+        table[:, :self.table.shape[1]] = self.table
+        self.table = table
+
+
+##################### Placement kernel #######################################################################################
+
+def minimumImage(d, box):
+    '''
+    Vectorised version of the pages' rnd lambda: i - round(i/box)*box, applied to the last axis
+    '''
+    return d - np.round(d / box) * box
+
+
+def boxSampler(box):
+    '''
+    Candidate positions spread uniformly over the periodic box (amorphous and porous carbon)
+    '''
+    box = np.broadcast_to(np.asarray(box, dtype=np.float64), (3,))
+    return lambda rng, size: rng.random((size, 3)) * box
+
+
+def layeredSampler(box, spacing, disorder, fraction=1.0):
+    '''
+    Candidate positions in a stack of planes normal to z (layered amorphous graphite)
+
+    The number of planes is box/spacing rounded, so the stack stays periodic (the actual spacing is box/num_layers).
+    A candidate lands on a random plane, spread uniformly in x and y and normally in z with standard deviation
+    disorder; a share 1 - fraction of the candidates is spread over the whole box instead.
+    '''
+    box = np.broadcast_to(np.asarray(box, dtype=np.float64), (3,))
+    num_layers = max(1, int(round(box[2] / spacing)))
+    spacing = box[2] / num_layers
+    def sample(rng, size):
+        u = rng.random((size, 3)) * box
+        z = ((rng.integers(0, num_layers, size) + 0.5) * spacing + disorder * rng.normal(size=size)) % box[2]
+        u[:, 2] = np.where(rng.random(size) < fraction, z, u[:, 2])
+        return u
+    return sample
+
+
+def cylinderSampler(center, radius, height):
+    '''
+    Candidate positions spread uniformly inside a cylinder along z around center = (x, y) (nanotubes)
+    '''
+    def sample(rng, size):
+        u = rng.random((size, 3))
+        r = radius * np.sqrt(u[:, 0])
+        phi = 2 * np.pi * u[:, 1]
+        return np.stack([center[0] + r*np.cos(phi), center[1] + r*np.sin(phi), height * u[:, 2]], axis=1)
+    return sample
+
+
+def sphereSampler(center, radius):
+    '''
+    Candidate positions spread uniformly inside a sphere (fullerenes)
+    '''
+    center = np.asarray(center, dtype=np.float64)
+    def sample(rng, size):
+        d = rng.normal(size=(size, 3))
+        d *= (radius * np.cbrt(rng.random(size)) / np.linalg.norm(d, axis=1))[:, None]
+        return center + d
+    return sample
+
+
+def placeAtoms(out, box, cutoff, pore_centers=None, pore_radii=None, start=0, batch=512, progress=None, rng=None, labels=None, sampler=None):
+    '''
+    Fills ``out`` (shape (num_atoms, 3)) with random positions in a periodic box that are at least
+    ``cutoff`` apart, and outside the spheres given by pore_centers / pore_radii.
+
+    This is the same random sequential placement as the loops in the pages (draw a point,
+    throw it away if it clashes, keep it otherwise), but candidates are drawn and checked
+    in blocks against a cell list, so the cost per atom does not grow with the model size.
+    Candidates of one block are accepted in draw order, exactly as if they had been drawn one at a time.
+
+    Multi-species models pass ``labels``, the species index of every row (int array of len(out)), and a
+    symmetric (species x species) ``cutoff`` matrix. labels[start:] is the order in which the species are
+    placed: a rejected candidate is drawn again, before the next ones, with the same species.
+    On return labels[start:] holds the species of the rows actually written.
+
+    sampler(rng, size) draws the candidate positions, uniformly over the box by default
+    (see boxSampler / cylinderSampler / sphereSampler).
+
+    With start > 0 the first start rows of ``out`` are atoms that are already placed (e.g. a model being
+    extended): they are only indexed, and the remaining rows are filled around them.
+
+    progress, if given, is called with the fraction of atoms placed after every block.
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    box = np.broadcast_to(np.asarray(box, dtype=np.float64), (3,))
+    if sampler is None:
+        sampler = boxSampler(box)
+    num_atoms = len(out)
+
+    ## cutoff**2 of every species pair, looked up by the species indices of the two atoms
+    cutoff2 = np.atleast_2d(np.asarray(cutoff, dtype=np.float64))**2
+    if labels is None:
+        labels = np.zeros(num_atoms, dtype=np.int8)
+
+    if pore_centers is not None and len(pore_centers):
+        pore_centers = np.asarray(pore_centers, dtype=np.float64)
+        pore_radii2 = np.asarray(pore_radii, dtype=np.float64)**2
+    else:
+        pore_centers = None
+
+    cells = CellList(box, np.sqrt(cutoff2.max()))
+    cells.insert(np.arange(start, dtype=np.int32), np.asarray(out[:start], dtype=np.float64))
+    ct = start
+    carry = labels[:0].copy()   # species of the candidates rejected in the last block, drawn again first
+    empty_blocks = 0
+
+    while ct < num_atoms:
+        size = min(batch, num_atoms - ct)
+        queued = ct + len(carry)
+        species = np.concatenate([carry, labels[queued:queued + size - len(carry)]])
+        atoms = sampler(rng, size)
+        candidate = np.arange(size)
+
+        ## Make sure atoms are not inside a pore
+        if pore_centers is not None:
+            pore_distance = minimumImage(atoms[:, None, :] - pore_centers[None, :, :], box)
+            keep = ~np.any(np.einsum("ijk,ijk->ij", pore_distance, pore_distance) < pore_radii2, axis=1)
+            atoms, candidate = atoms[keep], candidate[keep]
+
+        ## Make sure atoms are not too close to atoms already placed
+        if ct and len(atoms):
+            nb = cells.neighbours(atoms)
+            valid = nb >= 0
+            nb = np.where(valid, nb, 0)
+            neighbour_pos = np.asarray(out[nb], dtype=np.float64)
+            atom_distance = minimumImage(neighbour_pos - atoms[:, None, :], box)
+            pair_cutoff2 = cutoff2[species[candidate][:, None], labels[nb]]
+            close = valid & (np.einsum("ijk,ijk->ij", atom_distance, atom_distance) < pair_cutoff2)
+            keep = ~np.any(close, axis=1)
+            atoms, candidate = atoms[keep], candidate[keep]
+
+        ## Make sure atoms of this block are not too close to each other (earlier draws win)
+        if len(atoms) > 1:
+            atom_distance = minimumImage(atoms[:, None, :] - atoms[None, :, :], box)
+            pair_cutoff2 = cutoff2[species[candidate][:, None], species[candidate][None, :]]
+            clash = np.triu(np.einsum("ijk,ijk->ij", atom_distance, atom_distance) < pair_cutoff2, k=1)
+            accepted = np.ones(len(atoms), dtype=bool)
+            for j in np.flatnonzero(clash.any(axis=0)):
+                if np.any(clash[:j, j] & accepted[:j]):
+                    accepted[j] = False
+            atoms, candidate = atoms[accepted], candidate[accepted]
+
+        rejected = np.ones(size, dtype=bool)
+        rejected[candidate] = False
+        carry = species[rejected]
+
+        if len(atoms) == 0:
+            empty_blocks += 1
+            if empty_blocks > 1000:
+                raise RuntimeError("Could not place any more atoms. The box is too full for this cutoff.")
+            continue
+        empty_blocks = 0
+
+        out[ct:ct + len(atoms)] = atoms
+        labels[ct:ct + len(atoms)] = species[candidate]
+        cells.insert(np.arange(ct, ct + len(atoms), dtype=np.int32), atoms)
+        ct += len(atoms)
+
+        if progress is not None:
+            progress((ct - start) / (num_atoms - start))
+
+    return out
@@ -0,0 +1,131 @@
+import numpy as np
+from mtg.placement import minimumImage
+
+### Achieved porosity of a pore layout
+###
+### poreCreator aims the sum of r**3/box**3 at the porosity, which ignores pore overlap, periodic wrapping and
+### the 4/3*pi of a sphere's volume. This measures the void the pores really leave by Monte-Carlo sampling:
+### one random point in every cell of a grid x grid x grid mesh (stratified sampling), tested against the pores.
+### Each pore only visits the cells of its bounding box, so hundreds of pores take a fraction of a second.
+
+
+def poreCoverage(centers, radii, box, grid=96, rng=None):
+    '''
+    How many pores contain the sample point of every cell of a grid x grid x grid mesh (flat, x slowest),
+    and the cells inside each pore. Every cell gets one uniformly jittered sample point (stratified sampling).
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    box = np.broadcast_to(np.asarray(box, dtype=np.float64), (3,))
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 3)
+    h = box / grid
+    num_samples = grid**3
+    jitter = rng.random((num_samples, 3), dtype=np.float32)   # sample point of every cell, in cell units
+    coverage = np.zeros(num_samples, dtype=np.uint16)          # how many pores contain each sample point
+
+    inside = []
+    for center, radius in zip(centers, radii):
+        axes = []
+        for k in range(3):
+            lo, hi = np.floor((center[k] - radius) / h[k]), np.floor((center[k] + radius) / h[k])
+            axes.append(np.arange(grid) if hi - lo + 1 >= grid else np.arange(lo, hi + 1).astype(np.int64) % grid)
+        ix, iy, iz = np.meshgrid(*axes, indexing="ij")
+        cells = ((ix * grid + iy) * grid + iz).ravel()
+        points = (np.stack([ix.ravel(), iy.ravel(), iz.ravel()], axis=1) + jitter[cells]) * h
+        d = minimumImage(points - center, box)
+        cells = cells[np.einsum("ij,ij->i", d, d) < radius**2]
+        coverage[cells] += 1
+        inside.append(cells)
+    return coverage, inside
+
+
+def porosityEstimate(centers, radii, box, grid=96, rng=None):
+    '''
+    Void fraction of a set of periodic spherical pores, and the volume each pore shares with the others
+
+    Returns a dict with
+        porosity, porosity_err      fraction of the box inside at least one pore, and its standard error
+        nominal                     sum of r**3/box**3, the porosity poreCreator aims at
+        spheres                     sum of the sphere volumes over the box volume (overlap counted twice)
+        pore_volume, pore_volume_err        volume of each pore inside the box [A^3]
+        overlap_volume, overlap_volume_err  volume of each pore that is also inside another pore [A^3]
+    The error bars are binomial standard errors, an upper bound for stratified sampling.
+    '''
+    box = np.broadcast_to(np.asarray(box, dtype=np.float64), (3,))
+    radii = np.asarray(radii, dtype=np.float64)
+    num_samples = grid**3
+    coverage, inside = poreCoverage(centers, radii, box, grid, rng)
+
+    volume = np.prod(box)
+    covered = np.count_nonzero(coverage)
+    p = covered / num_samples
+    n_pore = np.array([len(cells) for cells in inside])
+    n_overlap = np.array([np.count_nonzero(coverage[cells] > 1) for cells in inside])
+
+    def binomialError(n):
+        q = n / num_samples
+        return volume * np.sqrt(q * (1 - q) / num_samples)
+
+    return {"porosity": p, "porosity_err": np.sqrt(p * (1 - p) / num_samples),
+            "nominal": float(np.sum(radii**3) / volume), "spheres": float(np.sum(4/3 * np.pi * radii**3) / volume),
+            "pore_volume": n_pore / num_samples * volume, "pore_volume_err": binomialError(n_pore),
+            "overlap_volume": n_overlap / num_samples * volume, "overlap_volume_err": binomialError(n_overlap)}
+
+
+def modelPores(model):
+    '''
+    Centers [A] and radii of the pores of a porous carbon model: the O block, every pore of which the builders keep
+    the atoms out of, so the pores are exactly the void of the model. The radii come with the model (extras).
+    A POSCAR read from a file does not carry them, so every pore then gets the distance from its center to the
+    nearest atom: the largest sphere around the center that is free of atoms (a hair smaller, so round-off never
+    puts that atom inside).
+    '''
+    num_pores = model.counts[0]
+    box = model.box
+    centers = np.asarray(model.frac[:num_pores], dtype=np.float64) * box
+    if "pore_radii" in model.extras:
+        return centers, np.asarray(model.extras["pore_radii"], dtype=np.float64)
+    if model.num_atoms == num_pores:
+        raise ValueError("The model has no atoms to tell the size of its pores from.")
+    atoms = np.asarray(model.frac[num_pores:], dtype=np.float64) * box
+    radii = np.empty(num_pores)
+    for i, center in enumerate(centers):
+        d = minimumImage(atoms - center, box)
+        radii[i] = np.sqrt(np.einsum("ij,ij->i", d, d).min()) * (1 - 1e-6)
+    return centers, radii
+
+
+def modelPorosity(model, grid=96, rng=None):
+    '''
+    porosityEstimate of the pores of a porous carbon model (see modelPores)
+    '''
+    centers, radii = modelPores(model)
+    return porosityEstimate(centers, radii, model.box, grid, rng)
+
+
+def extensionPoreRadii(radii, box, porosity, num_pores, sample, max_draws=1000):
+    '''
+    Radii of num_pores new pores for a model being extended, whose pores have the given radii (in the new box)
+
+    The radii are drawn with sample() within what the existing pores leave of the porosity budget, the sum of
+    r**3/box**3 that poreCreator aims at the porosity: a radius that would use up the rest is drawn again, and the
+    last pore tops the sum up to the porosity, like poreCreator's last pore. Raises ValueError when nothing is left.
+    '''
+    if num_pores == 0:
+        return np.zeros(0)
+    left = porosity - np.sum(np.asarray(radii, dtype=np.float64)**3) / box**3
+    if left <= 1e-6:   # poreCreator's pores reach the porosity exactly, up to round-off
+        raise ValueError(f"The pores of the model already take up the porosity of {porosity:.2f}. Raise the porosity to add pores.")
+
+    new_radii = []
+    for _ in range(num_pores - 1):
+        for _ in range(max_draws):
+            radius = sample()
+            if 0 < radius**3 / box**3 < left:
+                break
+        else:
+            raise ValueError(f"Could not draw {num_pores} pores within the porosity left ({left:.3f}). Add fewer pores or lower the maximum pore size.")
+        new_radii.append(radius)
+        left -= radius**3 / box**3
+    new_radii.append((left * box**3)**(1/3))
+    return np.array(new_radii)
@@ -0,0 +1,95 @@
+import io
+import os
+import tempfile
+import numpy as np
+
+
+def poscarHeader(comment, scale, lattice, species, counts):
+    '''
+    Builds the POSCAR header, up to and including the "Direct" line
+
+    lattice is the three box lengths of the orthorhombic cell (multiplied by scale)
+    species and counts are the element names and the number of atoms of each, in file order
+    '''
+    a, b, c = lattice
+    return (f"{comment}\n"
+            f"{scale:10.6f}\n"
+            f"{a:2.6f} {0.0:2.6f} {0.0:2.6f}\n"
+            f"{0.0:2.6f} {b:2.6f} {0.0:2.6f}\n"
+            f"{0.0:2.6f} {0.0:2.6f} {c:2.6f}\n"
+            f"{'     '.join(species)} \n"
+            f"{'   '.join(str(n) for n in counts)} \n"
+            "Direct\n")
+
+
+def coordinateChunks(pos, scale, chunk_size=100000):
+    '''
+    Yields the "Direct" coordinate block as text, chunk_size atoms at a time
+
+    pos are cartesian positions (may be a disk-backed memmap) and scale is the box length
+    (or the three box lengths) used to turn them into fractional coordinates.
+    Only one chunk is ever held in memory as text.
+    '''
+    fmt = "%.8f" if pos.dtype == np.float32 else "%.16f"
+    for start in range(0, len(pos), chunk_size):
+        block = np.asarray(pos[start:start + chunk_size], dtype=np.float64) / scale
+        buffer = io.StringIO()
+        np.savetxt(buffer, block, fmt=fmt, delimiter=" ")
+        yield buffer.getvalue()
+
+
+def writePoscar(path, header, pos, scale, chunk_size=100000):
+    '''
+    Writes a POSCAR file chunk by chunk, returns the path
+    If path is None the file goes to a fresh temporary file
+    '''
+    if path is None:
+        fd, path = tempfile.mkstemp(prefix="POSCAR_", suffix=".vasp")
+        os.close(fd)
+    with open(path, "w") as f:
+        f.write(header)
+        for chunk in coordinateChunks(pos, scale, chunk_size):
+            f.write(chunk)
+    return path
+
+
+def readPoscar(text):
+    '''
+    Parses an orthorhombic POSCAR file (as written by these constructors) into
+    (comment, scale, lattice, species, counts, frac), frac being the "Direct" coordinates
+
+    Raises ValueError for files this app cannot use (non-orthorhombic cells, missing species line, ...)
+    '''
+    lines = text.splitlines()
+    try:
+        comment = lines[0].strip()
+        scale = float(lines[1].split()[0])
+        vectors = np.array([[float(x) for x in lines[i].split()[:3]] for i in (2, 3, 4)])
+        species = lines[5].split()
+        counts = [int(n) for n in lines[6].split()]
+    except (IndexError, ValueError):
+        raise ValueError("This does not look like a POSCAR file.")
+    if any(s.lstrip("-").isdigit() for s in species):
+        raise ValueError("The POSCAR file must list the element names above the atom counts.")
+    if len(species) != len(counts):
+        raise ValueError("The POSCAR file has a different number of element names and atom counts.")
+    if np.any(np.abs(vectors - np.diag(np.diag(vectors))) > 1e-8):
+        raise ValueError("Only orthorhombic boxes are supported.")
+    lattice = np.diag(vectors)
+
+    start = 7
+    if len(lines) > start and lines[start].strip().lower().startswith("s"):   # Selective dynamics
+        start += 1
+    if len(lines) <= start:
+        raise ValueError("The POSCAR file has no coordinates.")
+    mode = lines[start].strip().lower()
+    num_atoms = sum(counts)
+    try:
+        coords = np.array([[float(x) for x in line.split()[:3]] for line in lines[start + 1:start + 1 + num_atoms]])
+    except ValueError:
+        raise ValueError("Could not read the atom coordinates of the POSCAR file.")
+    if coords.shape != (num_atoms, 3):
+        raise ValueError(f"The POSCAR file lists {num_atoms} atoms but has {len(coords)} coordinates.")
+    if mode.startswith(("c", "k")):   # Cartesian
+        coords = coords / lattice
+    return comment, scale, lattice, species, counts, coords
@@ -0,0 +1,107 @@
+import numpy as np
+import plotly.graph_objects as go
+from mtg.porosity import modelPores
+
+### Level-of-detail 3D preview of generated models (plotly Scatter3d, rendered with WebGL)
+
+SAMPLE_SIZE = 200000   # atoms kept with a large-model file for previews
+SPECIES_COLORS = {"C": "#404040", "N": "#3050f8", "B": "#ffb5b5", "H": "#a0a0a0", "O": "#ff0d0d"}
+
+
+def decimate(points, budget, method="stratified", rng=None):
+    '''
+    Indices of at most budget points to draw
+
+    "random" draws a uniform random subset. "stratified" lays a grid of about budget cells over the
+    points and keeps one random point per occupied cell, so sparse regions are not thinned out
+    as much as dense ones and the preview stays evenly covered.
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    n = len(points)
+    if n <= budget:
+        return np.arange(n)
+    if method == "random":
+        return np.sort(rng.choice(n, budget, replace=False))
+
+    order = rng.permutation(n)
+    points = np.asarray(points, dtype=np.float64)[order]
+    low = points.min(axis=0)
+    span = np.maximum(points.max(axis=0) - low, 1e-12)
+    ## fewer cells than the budget, as not every cell is occupied (e.g. inside a pore or outside a tube)
+    k = max(int(np.cbrt(budget)), 1)
+    cells = np.minimum(((points - low) / span * k).astype(np.int64), k - 1)
+    cell_id = (cells[:, 0] * k + cells[:, 1]) * k + cells[:, 2]
+    _, first = np.unique(cell_id, return_index=True)
+    picked = order[first]
+    if len(picked) < budget:
+        rest = np.setdiff1d(order[:budget * 2], picked, assume_unique=True)
+        picked = np.concatenate([picked, rest[:budget - len(picked)]])
+    return np.sort(picked[:budget])
+
+
+def sampleRows(counts, num_pores=0, size=SAMPLE_SIZE, rng=None):
+    '''
+    Rows of a random subset of at most size atoms of a model with the given species counts, and the
+    species counts of that subset. The first num_pores rows (pore centers) are always kept.
+    Used to keep a small preview sample with large-model files.
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    atoms = np.arange(num_pores, sum(counts))
+    if len(atoms) > size:
+        atoms = np.sort(rng.choice(atoms, size, replace=False))
+    keep = np.concatenate([np.arange(num_pores), atoms])
+
+    species = np.repeat(np.arange(len(counts)), counts)[keep]
+    return keep, [int(np.sum(species == i)) for i in range(len(counts))]
+
+
+def _sphere(center, radius, resolution=12):
+    u, v = np.meshgrid(np.linspace(0, 2*np.pi, resolution), np.linspace(0, np.pi, resolution // 2 + 1))
+    x = center[0] + radius * np.cos(u) * np.sin(v)
+    y = center[1] + radius * np.sin(u) * np.sin(v)
+    z = center[2] + radius * np.cos(v)
+    rows, cols = u.shape
+    ## two triangles per grid quad
+    i0 = (np.arange(rows - 1)[:, None] * cols + np.arange(cols - 1)[None, :]).ravel()
+    faces = np.concatenate([np.stack([i0, i0 + 1, i0 + cols], axis=1), np.stack([i0 + 1, i0 + cols + 1, i0 + cols], axis=1)])
+    return np.stack([x.ravel(), y.ravel(), z.ravel()], axis=1), faces
+
+
+def previewFigure(model, budget=20000, method="stratified", show_pores=True, marker_size=2):
+    '''
+    Interactive 3D scatter of a model, drawing at most budget atoms
+
+    Porous carbon pores (the O block of models carrying pore radii) are drawn as translucent spheres
+    instead of points.
+    '''
+    box = model.box
+    pos = np.asarray(model.frac, dtype=np.float64) * box
+    species = np.repeat(np.arange(len(model.species)), model.counts)
+
+    num_pores = model.counts[0] if "pore_radii" in model.extras else 0
+    atoms = np.arange(num_pores, len(pos))
+    shown = atoms[decimate(pos[atoms], budget, method)]
+
+    fig = go.Figure()
+    for i, name in enumerate(model.species):
+        rows = shown[species[shown] == i]
+        if len(rows) == 0:
+            continue
+        fig.add_trace(go.Scatter3d(x=pos[rows, 0], y=pos[rows, 1], z=pos[rows, 2], mode="markers", name=f"{name} ({len(rows)} shown)",
+                                   marker=dict(size=marker_size, color=SPECIES_COLORS.get(name, "#2ca02c")), hoverinfo="skip"))
+
+    if show_pores and num_pores:
+        vertices, faces = [], []
+        for center, radius in zip(*modelPores(model)):
+            v, f = _sphere(center, radius)
+            faces.append(f + sum(len(x) for x in vertices))
+            vertices.append(v)
+        vertices, faces = np.concatenate(vertices), np.concatenate(faces)
+        fig.add_trace(go.Mesh3d(x=vertices[:, 0], y=vertices[:, 1], z=vertices[:, 2], i=faces[:, 0], j=faces[:, 1], k=faces[:, 2],
+                                color="#1f77b4", opacity=0.25, name=f"Pores ({num_pores})", showlegend=True, hoverinfo="skip"))
+
+    fig.update_layout(scene=dict(aspectmode="data", xaxis_title="x [Å]", yaxis_title="y [Å]", zaxis_title="z [Å]"),
+                      margin=dict(l=0, r=0, t=0, b=0), legend=dict(orientation="h"), uirevision="preview")
+    return fig
@@ -0,0 +1,80 @@
+import numpy as np
+
+### Random numbers of the constructors
+###
+### A model is fully determined by its inputs and one integer seed. Every random stage of a constructor draws from
+### its own named stream of that seed, so e.g. the pore layout does not change when only the atoms are drawn
+### differently (another engine, more atoms). Stream i is the i-th child of SeedSequence(seed), exactly what
+### SeedSequence(seed).spawn() would give, and childGenerators splits a stream further for parallel workers.
+### Extending a model draws from the "extend ..." streams keyed on the size of the model being extended, so an extension
+### never replays the draws of the build (or of an earlier extension) with the same seed.
+
+STREAMS = ["pore radii", "pores", "species", "cell-list", "reference", "template", "tiles", "seams",
+           "extend pore radii", "extend pores", "extend species", "extend cell-list"]   # only ever append, the index is the stream
+MAX_SEED = 2**32 - 1
+
+
+def newSeed():
+    '''
+    A fresh seed from the OS entropy source
+    '''
+    return int(np.random.SeedSequence().generate_state(1)[0])
+
+
+def seedSequence(seed, stream, *key):
+    return np.random.SeedSequence(seed, spawn_key=(STREAMS.index(stream),) + tuple(int(k) for k in key))
+
+
+def generator(seed, stream, *key):
+    '''
+    numpy Generator of one named stream of a seed. Integer keys pick an independent sub-stream,
+    e.g. generator(seed, "extend species", model.num_atoms)
+    '''
+    return np.random.default_rng(seedSequence(seed, stream, *key))
+
+
+def childGenerators(seed, stream, n):
+    '''
+    n independent Generators splitting one stream, e.g. one per worker building part of a model in parallel
+    '''
+    return [np.random.default_rng(s) for s in seedSequence(seed, stream).spawn(n)]
+
+
+def seededComment(comment, seed, engine="cell-list", large=False, tiles=None):
+    '''
+    POSCAR comment line with everything besides the inputs that decides the coordinates: the seed, the placement
+    engine, large-model mode (float32 positions, so acceptance right at the cutoff can differ) and the supercell tiles
+    '''
+    comment = f"{comment} seed={seed} engine={engine}"
+    if large:
+        comment += " large-model"
+    if tiles is not None:
+        comment += " tiles=" + "x".join(str(int(n)) for n in np.broadcast_to(tiles, (3,)))
+    return comment
+
+
+def seededName(seed, engine="cell-list", large=False):
+    '''
+    The part of a download file name that records the seed, the engine and large-model mode (see seededComment)
+    '''
+    return f"seed{seed}_{engine}" + ("_large" if large else "")
+
+
+class UniformBlocks:
+    '''
+    Drop-in for the random module's random() that hands out numbers drawn from a Generator in large blocks,
+    so the scalar loops of the reference engine do not pay for one Generator call per number
+    '''
+
+    def __init__(self, rng, block=3*4096):
+        self.rng = rng
+        self.block = block
+        self.buffer = rng.random(block)
+        self.i = 0
+
+    def random(self):
+        if self.i == self.block:
+            self.buffer = self.rng.random(self.block)
+            self.i = 0
+        self.i += 1
+        return float(self.buffer[self.i - 1])
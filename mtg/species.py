@@ -0,0 +1,53 @@
+import numpy as np
+
+### Elements the constructors can place, and their pair cutoffs
+
+ATOMIC_MASS = {"C": 12.0107, "N": 14.0067, "B": 10.811, "H": 1.00794, "O": 15.9994}   # amu
+COVALENT_RADIUS = {"C": 0.76, "N": 0.71, "B": 0.84, "H": 0.31, "O": 0.66}            # angstrom
+DOPANTS = ["N", "B", "H", "O"]
+
+
+def atomMassGram(species):
+    '''
+    Mass of one atom of each species in grams (1 amu = 1.66054e-24 g)
+    '''
+    return np.array([ATOMIC_MASS[s] for s in species]) * 1.66054e-24
+
+
+def defaultCutoffs(species, cutoff):
+    '''
+    Symmetric matrix of minimum distances between species pairs
+
+    The C-C entry is the page's cutoff; the other pairs are scaled by the sum of the covalent radii,
+    e.g. C-H gets cutoff * (0.76 + 0.31) / (2 * 0.76).
+    '''
+    r = np.array([COVALENT_RADIUS[s] for s in species])
+    return cutoff * (r[:, None] + r[None, :]) / (2 * COVALENT_RADIUS["C"])
+
+
+def checkCutoffs(cutoffs, num_species):
+    '''
+    Validates a pair cutoff matrix, returns it as a float array. A scalar means the same cutoff for every pair.
+    '''
+    cutoffs = np.asarray(cutoffs, dtype=np.float64)
+    if cutoffs.ndim == 0:
+        return np.full((num_species, num_species), float(cutoffs))
+    if cutoffs.shape != (num_species, num_species):
+        raise ValueError(f"The cutoff matrix must be {num_species}x{num_species}, one row and column per species.")
+    if not np.allclose(cutoffs, cutoffs.T):
+        raise ValueError("The cutoff matrix must be symmetric.")
+    if np.any(cutoffs <= 0):
+        raise ValueError("All cutoffs must be positive.")
+    return cutoffs
+
+
+def speciesLabels(counts, rng=None):
+    '''
+    Species index of every atom to place, in random order, so that all species are placed
+    side by side instead of one after the other
+    '''
+    if rng is None:
+        rng = np.random.default_rng()
+    labels = np.repeat(np.arange(len(counts), dtype=np.int8), counts)
+    rng.shuffle(labels)
+    return labels
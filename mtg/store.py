@@ -0,0 +1,129 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+## Defaults for the process-wide store shared by every session of the app
+MAX_STORE_BYTES = 512 * 2**20       # 512 MB of coordinate data in memory
+MAX_STORE_DISK_BYTES = 2 * 2**30    # 2 GB of POSCAR files on disk (large-model mode)
+STORE_TTL = 2 * 3600                # seconds an unused artifact is kept
+
+
+class ArtifactStore:
+    '''
+    Process-wide, size-capped store for generated models
+
+    Sessions keep only the handle returned by put(). Artifacts are evicted least-recently-used
+    first once max_bytes (memory) or max_disk_bytes (files on disk) is exceeded, and dropped when
+    they have not been used for ttl seconds. get() returns None for an evicted (or unknown) handle,
+    so callers must be ready to regenerate.
+    Anything with an ``nbytes`` attribute (numpy arrays, mtg.model.Model) can be stored. Artifacts
+    backed by a file (mtg.model.PoscarFile) also have a ``disk_bytes`` attribute and a release() method,
+    which is called when they leave the store.
+    Results derived from an artifact (e.g. its preview) can be put under a handle "<handle>/<name>",
+    they are then dropped together with the artifact.
+    '''
+
+    def __init__(self, max_bytes=MAX_STORE_BYTES, ttl=STORE_TTL, max_disk_bytes=MAX_STORE_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self.nbytes = 0
+        self.disk_bytes = 0
+        self._items = OrderedDict()   # handle -> (artifact, nbytes, disk bytes, last used)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, handle):
+        return self.get(handle) is not None
+
+    def put(self, artifact, handle=None):
+        if handle is None:
+            handle = uuid.uuid4().hex
+        else:
+            self.drop(handle)
+        size = int(artifact.nbytes)
+        disk = int(getattr(artifact, "disk_bytes", 0))
+        with self._lock:
+            self._items[handle] = (artifact, size, disk, time.monotonic())
+            self.nbytes += size
+            self.disk_bytes += disk
+            self._evict()
+        return handle
+
+    def get(self, handle):
+        with self._lock:
+            self._expire()
+            item = self._items.get(handle)
+            if item is None:
+                return None
+            artifact, size, disk, _ = item
+            self._items[handle] = (artifact, size, disk, time.monotonic())
+            self._items.move_to_end(handle)
+            return artifact
+
+    def drop(self, handle):
+        if handle is None:
+            return
+        with self._lock:
+            for key in [key for key in self._items if key == handle or key.startswith(handle + "/")]:
+                self._forget(self._items.pop(key))
+
+    def _forget(self, item):
+        artifact, size, disk, _ = item
+        self.nbytes -= size
+        self.disk_bytes -= disk
+        _release(artifact)
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._items:
+            handle, item = next(iter(self._items.items()))
+            if now - item[-1] <= self.ttl:
+                break
+            del self._items[handle]
+            self._forget(item)
+
+    def _evict(self):
+        self._expire()
+        ## the newest artifact always stays, even if it alone is over a cap
+        while (self.nbytes > self.max_bytes or self.disk_bytes > self.max_disk_bytes) and len(self._items) > 1:
+            _, item = self._items.popitem(last=False)
+            self._forget(item)
+
+
+def _release(artifact):
+    release = getattr(artifact, "release", None)
+    if release is not None:
+        release()
+
+
+_STORE = ArtifactStore()
+
+
+def artifactStore():
+    '''
+    The store shared by all sessions of this server process
+    '''
+    return _STORE
+
+
+def poscarDownload(handle):
+    '''
+    A no-argument callable for st.download_button that renders the stored model's POSCAR
+    only when the user actually clicks download. A model written to disk is read as bytes, not decoded to a string.
+    Streamlit holds every download in its in-memory media storage until the session moves on, outside the store's
+    caps, so a large-model download briefly costs its whole file size (about 33 bytes per atom) in server memory.
+    '''
+    def render():
+        model = artifactStore().get(handle)
+        if model is None:
+            raise LookupError("This model has expired from the server, please generate it again.")
+        if hasattr(model, "open"):
+            with model.open() as f:
+                return f.read()
+        return model.poscarText()
+    return render
@@ -0,0 +1,240 @@
+import argparse
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+import numpy as np
+from mtg import builders
+from mtg.model import Model
+from mtg.placement import CellList, minimumImage
+from mtg.seeding import newSeed, generator, seededComment
+from mtg.species import atomMassGram, checkCutoffs
+
+### Template bank: pre-built carbon models at the settings most requests use, served without generating anything
+###
+### A template keeps the atoms as float32 coordinates relative to the region they were placed in (the periodic box,
+### the nanotube cylinder or the fullerene sphere), so one template serves any vacuum and, by rescaling, densities
+### within DENSITY_TOL of its own as long as the rescaled atoms still keep the cutoff apart. Every download gets
+### a random symmetry operation and row order, so repeated downloads are not identical. The seed a template was built
+### with is part of its name, which goes into the POSCAR comment, so a served model can always be built again.
+###
+###     python -m mtg.templates build [--atoms 1000 2000 5000 10000] [--kinds amorphous nanotube fullerene]
+###     python -m mtg.templates list
+
+TEMPLATE_DIR = os.environ.get("MTG_TEMPLATE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates"))
+DENSITY_TOL = 0.05   # largest relative density change served by rescaling a template
+
+## The pages' default settings
+STANDARD_ATOMS = [1000, 2000, 5000, 10000]
+STANDARD_CUTOFF = 1.2
+STANDARD_DENSITY = {"amorphous": 2.44, "nanotube": 1.7, "fullerene": 2.26}
+STANDARD_ASPECT_RATIO = 1.3
+
+
+def _totalMass(num_atoms):
+    return atomMassGram(["C"])[0] * num_atoms
+
+
+def minimumDistance(pos, period, cutoff):
+    '''
+    Smallest periodic distance between two atoms, or 2*cutoff if no two atoms are closer than that
+    '''
+    pos = np.asarray(pos, dtype=np.float64)
+    cells = CellList(period, 2*cutoff)
+    cells.insert(np.arange(len(pos), dtype=np.int32), pos)
+    nb = cells.neighbours(pos)
+    valid = (nb >= 0) & (nb != np.arange(len(pos))[:, None])
+    d = minimumImage(pos[np.where(valid, nb, 0)] - pos[:, None, :], period)
+    r2 = np.where(valid, np.einsum("ijk,ijk->ij", d, d), np.inf)
+    return float(np.sqrt(min(r2.min(), (2*cutoff)**2)))
+
+
+##################### Building the bank ######################################################################################
+
+def buildTemplate(kind, num_atoms, density, cutoff=STANDARD_CUTOFF, aspect_ratio=STANDARD_ASPECT_RATIO, seed=None, directory=TEMPLATE_DIR):
+    '''
+    Generates one template with the cell-list engine, checks it and writes it to the bank, replacing any template
+    with the same settings (built from another seed). Returns the file path.
+
+    Coordinates are stored relative to the placement region: box fractions for amorphous graphite,
+    (x - center)/(2r), (y - center)/(2r), z/height for nanotubes and (pos - center)/(2r) for fullerenes.
+    The check uses true distances for the (non-periodic) nanotube cross-section and fullerene.
+    '''
+    if seed is None:
+        seed = newSeed()
+    mass = _totalMass(num_atoms)
+    with contextlib.redirect_stdout(io.StringIO()):
+        if kind == "amorphous":
+            size = (mass / density)**(1/3) / 1e-8   # box length
+            model = builders.amorphousGraphite({"C": num_atoms}, size, cutoff, "template", seed=seed)
+            unit = model.frac.astype(np.float64)
+            pos, period = unit * size, size
+        elif kind == "nanotube":
+            size = (mass / (density * aspect_ratio * 2*np.pi))**(1/3) * 1e8   # radius, as the page's default radius
+            height = 2*size * aspect_ratio
+            model = builders.carbonNanotube({"C": num_atoms}, size, height, 0.0, cutoff, "template", seed=seed)
+            pos = model.frac.astype(np.float64) * height
+            unit = (pos - [height/2, height/2, 0]) / [2*size, 2*size, height]
+            period = (6*size, 6*size, height)   # wide enough in x and y to never wrap
+        elif kind == "fullerene":
+            size = np.cbrt(3 * mass / density / (4*np.pi)) / 1e-8   # radius
+            model = builders.fullerene({"C": num_atoms}, size, 0.0, cutoff, "template", seed=seed)
+            pos = model.frac.astype(np.float64) * 2*size
+            unit = (pos - size) / (2*size)
+            period = 6*size
+        else:
+            raise ValueError(f"No templates for {kind!r}, choose from {', '.join(STANDARD_DENSITY)}.")
+
+    min_distance = minimumDistance(pos, period, cutoff)
+    if min_distance < cutoff * (1 - 1e-6):
+        raise RuntimeError(f"The {kind} template with {num_atoms} atoms has atoms {min_distance:.3f} Å apart, closer than the cutoff.")
+
+    os.makedirs(directory, exist_ok=True)
+    base = f"{kind}_{num_atoms}atoms_{density:g}gcc_{cutoff:g}A"
+    path = os.path.join(directory, f"{base}_seed{seed}.npz")
+    np.savez_compressed(path, unit=unit.astype(np.float32), kind=kind, num_atoms=num_atoms, density=density, cutoff=cutoff,
+                        aspect_ratio=aspect_ratio if kind == "nanotube" else np.nan, size=size, min_distance=min_distance, seed=seed)
+    ## earlier builds at the same settings (older banks have no seed in the name)
+    for old in [os.path.join(directory, base + ".npz")] + glob.glob(os.path.join(directory, glob.escape(base) + "_seed*.npz")):
+        if old != path and os.path.exists(old):
+            os.remove(old)
+    return path
+
+
+def templateIndex(directory=TEMPLATE_DIR):
+    '''
+    Metadata of every template in the bank (the coordinates are only read when a template is served)
+    '''
+    index = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.npz"))):
+        with np.load(path) as npz:
+            meta = {k: npz[k].item() for k in npz.files if k != "unit"}
+        meta["path"] = path
+        meta["name"] = os.path.splitext(os.path.basename(path))[0]
+        index.append(meta)
+    return index
+
+
+##################### Serving ################################################################################################
+
+def _match(kind, composition, cutoffs, size, aspect_ratio=None, directory=TEMPLATE_DIR):
+    '''
+    The template that fits best, as (metadata, scale) with scale = requested size / template size, or None
+    '''
+    if list(composition) != ["C"] or not os.path.isdir(directory):
+        return None
+    cutoff = float(checkCutoffs(cutoffs, 1)[0, 0])
+    best = None
+    for meta in templateIndex(directory):
+        if meta["kind"] != kind or meta["num_atoms"] != composition["C"] or abs(meta["cutoff"] - cutoff) > 1e-6:
+            continue
+        if aspect_ratio is not None and abs(meta["aspect_ratio"] - aspect_ratio) > 1e-6 * aspect_ratio:
+            continue
+        scale = size / meta["size"]
+        ## density goes as 1/scale**3; shrinking must not push atoms closer than the cutoff
+        if abs(scale**-3 - 1) > DENSITY_TOL or meta["min_distance"] * scale < cutoff * (1 - 1e-9):
+            continue
+        if best is None or abs(scale - 1) < abs(best[1] - 1):
+            best = (meta, scale)
+    return best
+
+
+def _unit(meta):
+    with np.load(meta["path"]) as npz:
+        return npz["unit"].astype(np.float64)
+
+
+def _comment(comment, meta, seed):
+    ## the template name carries the seed it was built with, seed is the one that oriented it
+    return seededComment(f"{comment} template={meta['name']}", seed)
+
+
+def amorphousTemplate(composition, box, cutoffs, comment, seed=None, directory=TEMPLATE_DIR):
+    '''
+    An amorphous graphite model from the bank, like builders.amorphousGraphite would make it, or None if no template fits.
+    The template is shifted by a random vector and transformed by one of the 48 symmetries of the cube.
+    '''
+    found = _match("amorphous", composition, cutoffs, box, directory=directory)
+    if found is None:
+        return None
+    meta, _ = found
+    seed = newSeed() if seed is None else seed
+    rng = generator(seed, "template")
+
+    unit = _unit(meta)[:, rng.permutation(3)]
+    unit = (unit * rng.choice([-1.0, 1.0], 3) + rng.random(3)) % 1.0
+    unit = unit[rng.permutation(len(unit))]
+    return Model(_comment(comment, meta, seed), box, (1.0, 1.0, 1.0), ["C"], [len(unit)], unit, extras={"template_seed": meta["seed"]})
+
+
+def nanotubeTemplate(composition, radius, height, vacuum, cutoffs, comment, seed=None, directory=TEMPLATE_DIR):
+    '''
+    A nanotube model from the bank, like builders.carbonNanotube would make it, or None if no template fits.
+    The template is rotated about and shifted along the tube axis, and possibly flipped.
+    '''
+    found = _match("nanotube", composition, cutoffs, radius, aspect_ratio=height / (2*radius), directory=directory)
+    if found is None:
+        return None
+    meta, _ = found
+    seed = newSeed() if seed is None else seed
+    rng = generator(seed, "template")
+
+    unit = _unit(meta)
+    phi = 2*np.pi * rng.random()
+    x, y = unit[:, 0], unit[:, 1] * rng.choice([-1.0, 1.0])
+    z = (unit[:, 2] * rng.choice([-1.0, 1.0]) + rng.random()) % 1.0
+    pos = np.stack([height/2 + 2*radius * (x*np.cos(phi) - y*np.sin(phi)), height/2 + 2*radius * (x*np.sin(phi) + y*np.cos(phi)), z * height], axis=1)
+    pos = pos[rng.permutation(len(pos))]
+    return Model(_comment(comment, meta, seed), 1.0, (radius + vacuum, radius + vacuum, height), ["C"], [len(pos)], pos/height, extras={"template_seed": meta["seed"]})
+
+
+def fullereneTemplate(composition, radius, vacuum, cutoffs, comment, seed=None, directory=TEMPLATE_DIR):
+    '''
+    A fullerene model from the bank, like builders.fullerene would make it, or None if no template fits.
+    The template gets a random rotation (or rotoreflection).
+    '''
+    found = _match("fullerene", composition, cutoffs, radius, directory=directory)
+    if found is None:
+        return None
+    meta, _ = found
+    seed = newSeed() if seed is None else seed
+    rng = generator(seed, "template")
+
+    ## random orthogonal matrix from the QR decomposition of a Gaussian matrix
+    q, r = np.linalg.qr(rng.normal(size=(3, 3)))
+    q *= np.sign(np.diag(r))
+    big_box = 2*radius + vacuum
+    pos = big_box/2 + 2*radius * (_unit(meta) @ q.T)
+    pos = pos[rng.permutation(len(pos))]
+    return Model(_comment(comment, meta, seed), 1.0, (big_box, big_box, big_box), ["C"], [len(pos)], pos/big_box, extras={"template_seed": meta["seed"]})
+
+
+##################### Batch command ##########################################################################################
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m mtg.templates", description="Builds and lists the template bank.")
+    parser.add_argument("--dir", default=TEMPLATE_DIR, help="bank directory (default: $MTG_TEMPLATE_DIR or ./templates)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="(re)build templates at the standard settings, replacing existing ones")
+    build.add_argument("--kinds", nargs="+", default=list(STANDARD_DENSITY), choices=list(STANDARD_DENSITY))
+    build.add_argument("--atoms", nargs="+", type=int, default=STANDARD_ATOMS)
+    build.add_argument("--cutoff", type=float, default=STANDARD_CUTOFF)
+    commands.add_parser("list", help="show the templates in the bank")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        for kind in args.kinds:
+            for num_atoms in args.atoms:
+                start = time.perf_counter()
+                path = buildTemplate(kind, num_atoms, STANDARD_DENSITY[kind], args.cutoff, directory=args.dir)
+                print(f"{path}  ({time.perf_counter() - start:.1f} s)")
+    else:
+        for meta in templateIndex(args.dir):
+            print(f"{meta['name']:<45} min distance {meta['min_distance']:.3f} Å   seed {meta['seed']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,386 @@
+import contextlib
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from mtg.builders import ENGINES
+from mtg.jobs import jobScheduler, QueueFull, UserLimitReached
+from mtg.model import Model, PoscarFile
+from mtg.preview import previewFigure
+from mtg.seeding import newSeed, MAX_SEED
+from mtg.species import DOPANTS, defaultCutoffs, checkCutoffs
+from mtg.store import artifactStore, poscarDownload
+
+### Streamlit pieces shared by the constructor pages
+
+
+def currentUser():
+    '''
+    Who the per-user job limit applies to: the signed-in user when the app uses authentication, otherwise the browser session.
+    Not the client address, which behind a reverse proxy or NAT is the same for every visitor.
+    '''
+    if st.user.get("is_logged_in"):
+        return "user:" + str(st.user.get("email") or st.user.get("sub"))
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else "local"
+
+
+@contextlib.contextmanager
+def parameterForm(on_submit=None, args=()):
+    '''
+    Sidebar form for the page's parameters: editing them does not rerun the page, pressing Apply does (once).
+    Widgets inside cannot have callbacks, on_submit is called on Apply instead.
+    '''
+    with st.sidebar.form("parameters", border=False):
+        try:
+            yield
+        finally:
+            ## also when an input stops the page (e.g. an invalid cutoff table), so it can still be corrected
+            st.form_submit_button("Apply", on_click=on_submit, args=args, type="primary", use_container_width=True)
+
+
+def compositionInputs(num_carbon, dopants=DOPANTS):
+    '''
+    Inputs for the dopant atoms added to the page's carbon atoms (inside the page's parameterForm).
+    Returns the species in the model (carbon first) and the number of atoms of each.
+    '''
+    with st.expander("Dopants"):
+        num_dopants = [st.number_input(f"Number of {s} atoms:", min_value=0, value=0, step=1, key=f"num_{s}") for s in dopants]
+    species = ["C"] + [s for s, n in zip(dopants, num_dopants) if n]
+    return species, [num_carbon] + [n for n in num_dopants if n]
+
+
+def cutoffMatrix(species, cutoff):
+    '''
+    Minimum distances between all species pairs, from the C-C cutoff scaled by the covalent radii.
+    Doped models get an editable table (inside the page's parameterForm), of which only the upper triangle is used (the matrix is symmetric).
+    '''
+    cutoffs = defaultCutoffs(species, cutoff)
+    if len(species) == 1:
+        return cutoffs
+
+    st.caption("Pair cutoffs [\u212B] (the upper triangle is used)")
+    table = st.data_editor(pd.DataFrame(np.round(cutoffs, 2), index=species, columns=species), key="cutoffs_" + "".join(species))
+    upper = np.triu(table.to_numpy(dtype=float))
+    try:
+        return checkCutoffs(upper + np.triu(upper, 1).T, len(species))
+    except ValueError as e:
+        st.error(str(e))
+        st.stop()
+
+
+def engineInput():
+    '''
+    Choice of the placement engine (inside the page's parameterForm)
+    '''
+    return st.selectbox("Placement engine", options=ENGINES, key="engine",
+                        help="cell-list is the fast default. reference is the original one-atom-at-a-time loop (carbon only), kept to compare against")
+
+
+def templateInput():
+    '''
+    Switch for the template bank (inside the page's parameterForm), see generateModel
+    '''
+    return st.toggle("Use template bank", value=False, key="use_templates",
+                     help="Serve a pre-built model instantly when one matches these settings (carbon only, cell-list engine, density within 5% of a template). "
+                          "The model is then a re-oriented copy of the template: its POSCAR comment and file name also carry the seed the template was built with.")
+
+
+def _rollSeed(on_change, args):
+    st.session_state.seed = newSeed()
+    if on_change is not None:
+        on_change(*args)
+
+
+def seedInput(on_change=None, args=()):
+    '''
+    Sidebar input of the random seed, starting from a fresh one in every session.
+    The same inputs and seed always give the same model.
+    '''
+    if "seed" not in st.session_state:
+        st.session_state.seed = newSeed()
+    c1, c2 = st.sidebar.columns([4, 1], vertical_alignment="bottom")
+    c1.number_input("Random seed", min_value=0, max_value=MAX_SEED, step=1, key="seed", on_change=on_change, args=args,
+                    help="Written in the POSCAR comment line and file name. Generate again with the same inputs and seed to get the same model.")
+    c2.button("\U0001F3B2", key="newSeedButton", help="New random seed", on_click=_rollSeed, args=(on_change, args))
+    return st.session_state.seed
+
+
+def _slot(page):
+    '''
+    Job and model bookkeeping of one constructor page. Session state is shared by all pages of the app,
+    so each page keeps its own slot.
+    '''
+    key = f"{page}_model_slot"
+    if key not in st.session_state:
+        st.session_state[key] = {"job_id": None, "job_file_name": None, "job_error": None, "model_handle": None, "model_file_name": None}
+    return st.session_state[key]
+
+
+def modelHandle(page):
+    return _slot(page)["model_handle"]
+
+
+def modelFileName(page):
+    return _slot(page)["model_file_name"]
+
+
+def currentModel(page):
+    '''
+    The last model generated on this page, or None (nothing generated yet, or evicted from the store)
+    '''
+    return artifactStore().get(modelHandle(page))
+
+
+def submitJob(page, fn, *args, file_name, **kwargs):
+    '''
+    Queues a model generation job for this page. file_name is the name the model is downloaded under
+    '''
+    slot = _slot(page)
+    try:
+        ## the page's last job is cancelled only once the scheduler has taken this one, otherwise it carries on
+        slot["job_id"] = jobScheduler().submit(currentUser(), fn, *args, replaces=slot["job_id"], **kwargs)
+    except (QueueFull, UserLimitReached) as e:
+        st.warning(str(e))
+        return
+    slot["job_file_name"] = file_name
+    ## the current model stays until the new one is in (see _jobProgress), so a failed job does not lose it
+    slot["job_error"] = None
+
+
+def serveModel(page, model, file_name):
+    '''
+    Makes an already built model (e.g. from the template bank) this page's model, cancelling any queued job
+    '''
+    slot = _slot(page)
+    if slot["job_id"] is not None:
+        jobScheduler().cancel(slot["job_id"])
+        slot["job_id"] = None
+    artifactStore().drop(slot["model_handle"])
+    slot["model_handle"] = artifactStore().put(model)
+    slot["model_file_name"] = file_name
+    slot["job_error"] = None
+
+
+def generateModel(page, template, fn, *args, file_name, seed, **kwargs):
+    '''
+    Makes a new model for this page. With the template bank on (and the cell-list engine), template() is served at once
+    unless it returns None (no template matches); anything else is built by fn(*args, seed=seed, **kwargs) in a worker
+    process, so this session (and everyone else's) stays responsive. Pass template=None for settings the bank never covers.
+    '''
+    model = None
+    if template is not None and st.session_state.use_templates and st.session_state.engine == "cell-list":
+        model = template()
+    if model is not None:
+        serveModel(page, model, file_name.replace(f"seed{seed}", f"template{model.extras['template_seed']}_seed{seed}"))
+    else:
+        submitJob(page, fn, *args, file_name=file_name, seed=seed, **kwargs)
+
+
+@st.fragment(run_every=1)
+def _jobProgress(page):
+    slot = _slot(page)
+    job_id = slot["job_id"]
+    state, detail = jobScheduler().status(job_id)
+
+    if state == "queued":
+        st.info(f"Waiting for a free worker. Position {detail} in the queue.", icon="⏳")
+    elif state == "running":
+        st.progress(min(detail, 1.0), text="Progress Status.")
+    else:
+        slot["job_id"] = None
+        if state == "done":
+            artifactStore().drop(slot["model_handle"])
+            slot["model_handle"] = artifactStore().put(jobScheduler().result(job_id))
+            slot["model_file_name"] = slot["job_file_name"]
+        elif state == "failed":
+            jobScheduler().cancel(job_id)
+            slot["job_error"] = detail
+        st.rerun()
+
+
+def jobProgress(page):
+    '''
+    Shows the queue position / progress of this page's job, polling only this part of the page.
+    The whole page reruns once the model is ready.
+    '''
+    slot = _slot(page)
+    if slot["job_id"] is not None:
+        _jobProgress(page)
+    if slot["job_error"]:
+        st.error(f"Model generation failed: {slot['job_error']}")
+
+
+def baseModel(page, upload_key=None):
+    '''
+    The model to extend: the uploaded POSCAR if there is one, otherwise the last model generated on this page.
+    Shows a message and returns None when there is nothing usable.
+    '''
+    upload = st.session_state.get(upload_key) if upload_key else None
+    if upload is not None:
+        try:
+            return Model.fromPoscar(upload.getvalue().decode())
+        except (ValueError, UnicodeDecodeError) as e:
+            st.error(f"Could not use {upload.name}: {e}")
+            return None
+
+    model = currentModel(page)
+    if not isinstance(model, Model):
+        st.warning("There is no model to extend. Generate one first" + (" or upload a POSCAR file." if upload_key else "."))
+        return None
+    return model
+
+
+class _Memo:
+    '''
+    A modelMemo result in the artifact store, sized so that it counts against the store's cap
+    '''
+
+    def __init__(self, value):
+        self.value = value
+        self.nbytes = _memoBytes(value)
+
+
+def _memoBytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_memoBytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_memoBytes(v) for v in value)
+    if isinstance(value, go.Figure):
+        ## the point and mesh arrays of the preview traces
+        return sum(_memoBytes(trace[p]) for trace in value.data for p in ("x", "y", "z", "i", "j", "k") if p in trace)
+    return 64
+
+
+def modelMemo(page, name, compute, *key):
+    '''
+    compute() for this page's model, remembered under the model handle (and key) so reruns do not redo it.
+    The results live in the server's artifact store, so they count against its size cap and go when the model goes.
+    The session only keeps the model handle.
+    '''
+    handle = modelHandle(page)
+    if handle is None:
+        return compute()
+    memo_handle = _memoHandle(handle, name, key)
+    memo = artifactStore().get(memo_handle)
+    if memo is None:
+        memo = _Memo(compute())
+        artifactStore().put(memo, handle=memo_handle)
+    return memo.value
+
+
+def _memoHandle(handle, name, key):
+    return "/".join([handle, name] + [str(k) for k in key])
+
+
+def _memoSlot(page, name):
+    key = f"{page}_{name}_memo_job"
+    if key not in st.session_state:
+        st.session_state[key] = {"memo_handle": None, "job_id": None, "error": None}
+    return st.session_state[key]
+
+
+def jobMemo(page, name, fn, *args, key=()):
+    '''
+    modelMemo for analyses too slow for the script thread: fn(*args) runs in a worker process like a model build
+    (fn must be importable and take a progress keyword). Returns the result once it is ready and None until then,
+    showing the queue position or progress meanwhile. The page reruns when the result comes in.
+    '''
+    handle = modelHandle(page)
+    if handle is None:
+        return None
+    memo_handle = _memoHandle(handle, name, key)
+    memo = artifactStore().get(memo_handle)
+    if memo is not None:
+        return memo.value
+
+    slot = _memoSlot(page, name)
+    if slot["memo_handle"] != memo_handle or (slot["job_id"] is None and slot["error"] is None):
+        ## other settings (or a result evicted from the store): the job for the old ones is no longer wanted
+        try:
+            job_id = jobScheduler().submit(currentUser(), fn, *args, replaces=slot["job_id"])
+        except (QueueFull, UserLimitReached) as e:
+            st.warning(str(e))
+            return None
+        slot.update(memo_handle=memo_handle, job_id=job_id, error=None)
+
+    if slot["error"]:
+        st.error(f"The analysis failed: {slot['error']}")
+    else:
+        _memoProgress(page, name)
+    return None
+
+
+def cancelMemo(page, name):
+    '''
+    Cancels the job jobMemo started for this page's analysis, if it is still pending
+    '''
+    slot = _memoSlot(page, name)
+    jobScheduler().cancel(slot["job_id"])
+    slot.update(memo_handle=None, job_id=None, error=None)
+
+
+@st.fragment(run_every=1)
+def _memoProgress(page, name):
+    slot = _memoSlot(page, name)
+    job_id = slot["job_id"]
+    state, detail = jobScheduler().status(job_id)
+
+    if state == "queued":
+        st.info(f"Waiting for a free worker. Position {detail} in the queue.", icon="⏳")
+    elif state == "running":
+        st.progress(min(detail, 1.0), text="Analysing.")
+    else:
+        slot["job_id"] = None
+        if state == "done":
+            artifactStore().put(_Memo(jobScheduler().result(job_id)), handle=slot["memo_handle"])
+        elif state == "failed":
+            jobScheduler().cancel(job_id)
+            slot["error"] = detail
+        st.rerun()
+
+
+@st.fragment
+def modelOutput(page, download_disabled=False, on_download=None, args=(), notice=None, details=None):
+    '''
+    POSCAR excerpt and download of this page's model, then details(model) if given.
+    A fragment, so downloading or using the widgets of details only reruns this part of the page.
+    '''
+    model = currentModel(page)
+    if model is None:
+        return
+    st.text_area("POSCAR File (first 20 atoms)", modelMemo(page, "excerpt", lambda: model.poscarText(max_atoms=20)))
+
+    st.success('Done!')
+    if notice:
+        st.info(notice, icon="ℹ️")
+
+    if st.download_button(label="Download POSCAR", key="downloadPOSCAR", data=poscarDownload(modelHandle(page)), file_name=modelFileName(page),
+                          disabled=download_disabled, on_click=on_download or "rerun", args=args):
+        st.write("Download Complete.")
+    if details is not None:
+        details(model)
+
+
+@st.fragment
+def modelPreview(page, model):
+    '''
+    Optional interactive 3D view of a model. Only a decimated subset of the atoms is sent to the browser.
+    A fragment, so changing the view settings only reruns the preview.
+    '''
+    if not st.toggle("Show 3D preview", key=f"{page}_preview", help="Interactive view of the model. Large models are thinned out to the point budget."):
+        return
+    if isinstance(model, PoscarFile):
+        model = model.sample
+
+    c1, c2 = st.columns(2)
+    budget = c1.select_slider("Point budget", options=[2000, 5000, 10000, 20000, 50000, 100000], value=20000, key=f"{page}_preview_budget",
+                              help="At most this many atoms are drawn")
+    method = c2.radio("Decimation", options=["stratified", "random"], horizontal=True, key=f"{page}_preview_method",
+                      help="Stratified keeps one atom per grid cell, so the whole model stays evenly covered")
+    st.plotly_chart(modelMemo(page, "preview", lambda: previewFigure(model, budget, method), budget, method), use_container_width=True)
@@ -1,8 +1,12 @@
 import streamlit as st
-import random as ran
 import numpy as np
 import pandas as pd
-import time
+from mtg import builders, templates
+from mtg.seeding import seededName
+from mtg.species import ATOMIC_MASS
+from mtg.ui import parameterForm, submitJob, generateModel, jobProgress, baseModel, currentModel, modelOutput, modelPreview, compositionInputs, cutoffMatrix, engineInput, templateInput, seedInput
+
+PAGE = "amorphous_graphite"   ## key of this page's jobs and models in the session
 
 
 ### Set up Page ###########
@@ -34,24 +38,43 @@ def disable(b):
 
 
 ## Initialize Data
-st.sidebar.number_input("Number of Atoms:", min_value=60, value=1000, step = 50, key="num_atoms",on_change=disable, args=(False,), help="The number of C atoms required")
-st.sidebar.number_input("Density [g/cm$^3$]:", min_value=2.0, max_value = 4.0, value = 2.44, step = 0.02, key="density",on_change=disable, args=(False,), help ="The desired density of the model")
-st.sidebar.slider("Carbon Bonds Initial Cutoff [\u212B]", min_value=1.0,max_value=1.4, step = 0.1, value =1.2, key='cutoff',on_change=disable, args=(False,), help="C-C cutoff, 1.2 \u212B is a good choice")
-
+## Parameters are batched in a form, so editing them does not rerun the page until Apply is pressed
+with parameterForm(on_submit=disable, args=(False,)):
+    st.number_input("Number of Atoms:", min_value=60, value=1000, step = 50, key="num_atoms", help="The number of C atoms required")
+    species, counts = compositionInputs(st.session_state.num_atoms)
+    st.number_input("Density [g/cm$^3$]:", min_value=2.0, max_value = 4.0, value = 2.44, step = 0.02, key="density", help ="The desired density of the model")
+    st.slider("Carbon Bonds Initial Cutoff [\u212B]", min_value=1.0,max_value=1.4, step = 0.1, value =1.2, key='cutoff', help="C-C cutoff, 1.2 \u212B is a good choice")
+    st.toggle("Large-model mode", value=False, key="large_model", help="For multi-million atom models: positions are kept on disk as float32 and the POSCAR is written in chunks. No text preview of the full file.")
+    cutoffs = cutoffMatrix(species, st.session_state.cutoff)
+    with st.expander("Layered seeding"):
+        st.toggle("Seed in layers", value=False, key="layered", help="Seed the atoms preferentially in a stack of planes normal to z, closer to the layered sp2 structure the MD would otherwise have to form")
+        st.number_input("Interlayer Spacing [\u212B]", min_value=1.0, max_value=10.0, value=3.35, step=0.05, key="layer_spacing", help="Rounded so a whole number of layers fits the box. 3.35 \u212B is the graphite spacing")
+        st.slider("In-plane Disorder [\u212B]", min_value=0.0, max_value=1.0, value=0.3, step=0.05, key="layer_disorder", help="Standard deviation of the atoms' distance from their plane")
+        st.slider("Atoms Seeded in Layers [%]", min_value=0, max_value=100, value=100, step=5, key="layer_percent", help="The rest are seeded uniformly. Lower it if the planes are too full for the density and cutoff")
+    engineInput()
+    templateInput()
+seed = seedInput(on_change=disable, args=(False,))
 
 # You can access the value at any point with:
 # st.session_state.num_atoms
 # st.session_state.density
 # st.session_state.cutoff
+# st.session_state.large_model
 
-st.session_state.num_atoms_arr = np.array([st.session_state.num_atoms], dtype = np.int64)
+st.session_state.species = species
+st.session_state.num_atoms_arr = np.array(counts, dtype = np.int64)
+composition = dict(zip(species, counts))
 
 ### Naming convention for saved files ##########################################################
 stringDensity = str(np.round(st.session_state.density,2)).replace(".","p")+"gcc_"
-stringNumAtoms = str(st.session_state.num_atoms)+"atoms_"
-
-
-st.session_state.atoms_vasp = "POSCAR_"+stringNumAtoms+stringDensity
+stringNumAtoms = str(st.session_state.num_atoms)+"atoms_"+"".join(f"{n}{s}_" for s, n in zip(species[1:], counts[1:]))
+stringSeed = seededName(seed, st.session_state.engine, st.session_state.large_model)
+layers = (st.session_state.layer_spacing, st.session_state.layer_disorder, st.session_state.layer_percent/100) if st.session_state.layered else None
+stringLayers = "" if layers is None else "layered"+str(np.round(layers[0],2)).replace(".","p")+"A_"
+
+st.session_state.atoms_vasp = "POSCAR_"+stringNumAtoms+stringDensity+stringLayers+stringSeed
+## extensions are built in memory with the cell-list engine, whatever the settings
+st.session_state.extended_vasp = "POSCAR_"+stringNumAtoms+stringDensity+stringLayers+"extended_"+seededName(seed)
 #################################################################################################
 
 ##################### FUNCTIONS ##############################################################################################
@@ -62,7 +85,7 @@ def boxSize(density):
     This function predicts the box size for the model, in units of angstrom
     '''
 
-    atom_mass_amu = np.array([12.0107])
+    atom_mass_amu = np.array([ATOMIC_MASS[s] for s in st.session_state.species])
     atom_mass_gram = [atom*1.66054e-24 for atom in atom_mass_amu]  #Convert amu to grams (1 amu = 1.66054e-24 g)
 
     total_mass = sum([atom_mass_gram[i]*st.session_state.num_atoms_arr[i] for i in range(np.size(atom_mass_gram))])
@@ -75,7 +98,6 @@ def boxSize(density):
 
 # Some Parameter Initialization
 st.session_state.box, volume = boxSize(st.session_state.density)
-st.session_state.final_output = ""
 
 ################################### MAIN ################################################################
 
@@ -87,72 +109,31 @@ with col1:
     if st.button('Generate Model', key="generateButton",on_click=disable, args=(False,)):
         with col1:
             
-            st.write(f"The box length for {st.session_state.num_atoms} C atoms is {st.session_state.box:.2f} \u212B")
-
-
-        ######################## Amorphous C constructor Algorithm starts here ####################################################
-
-        pos = np.zeros([st.session_state.num_atoms,3],float)   ## A list that takes in the position of the atoms
-        
-        box = st.session_state.box
-        num_atoms = st.session_state.num_atoms
-        cutoff = st.session_state.cutoff
-
-        ct = 0
-        rnd = lambda i: i-round(i/box)*box  ## This makes rnd a function that takes i and perform i - round(i/box)*box
-        vec_rnd = np.vectorize(rnd)         ## takes  a function and gives result in a callable vectorised function
- 
-     
-        with st.spinner("Creating carbon atoms. Please wait..."):
-            my_bar = st.progress(0, text="Progress Status.")
-
-            while ct < num_atoms:
-                atoms =[box*ran.random(),box*ran.random(),box*ran.random()]
-                test = 0
-    
-                ### Uncomment for debugging
-                #print (atoms-pos[test][:])
-                ###########################
-    
-                while test < ct:
-                    atom_distance = atoms-pos[test][:]
-                    atom_distance = vec_rnd(atom_distance)
-                   
-                    ### Position the atoms if atoms are not close to center    
-                    if sum(map(lambda i: i*i, atom_distance)) < cutoff**2:
-                        atoms =np.array([box*ran.random(),box*ran.random(),box*ran.random()])
-                        
-                        ### Uncomment for debugging##################
-                        #print ("OOPS!!! TOO CLOSE to another atom")
-                        #############################################
-            
-                        test = 0
-                    else:
-                        test += 1
-            
-                pos[ct][:] = atoms
-    
-    
-                ct +=1
-                my_bar.progress(ct/(num_atoms), text="Progress Status.")         
-                print (f"Placing Atom number {ct} of {num_atoms}", end='\r')
-         ################################################################################################
-
-        my_bar.empty()
-        with st.spinner("Preparing file for download. Please wait..."):
-            time.sleep(5)
-
-    
-        atom_position = pos/st.session_state.box
-
-        #Convert the NumPy array to a list of lists
-        list_of_lists = atom_position.tolist()
-
-        #Convert each sublist to a string with elements separated by spaces
-        lines = [" ".join(map(str, sublist)) for sublist in list_of_lists]
-
-        #Join the resulting lines with newline characters
-        st.session_state.final_output = "\n".join(lines)
+            st.write(f"The box length for {', '.join(f'{n} {s}' for s, n in composition.items())} atoms is {st.session_state.box:.2f} \u212B")
+
+        ## the bank has no large-model or layered templates
+        template = None
+        if not st.session_state.large_model and layers is None:
+            template = lambda: templates.amorphousTemplate(composition, st.session_state.box, cutoffs, f"{stringNumAtoms} {stringDensity}", seed=seed)
+        generateModel(PAGE, template, builders.amorphousGraphite, composition, st.session_state.box, cutoffs, f"{stringNumAtoms} {stringDensity}{stringLayers}",
+                      large=st.session_state.large_model, engine=st.session_state.engine, seed=seed, layers=layers, file_name=st.session_state.atoms_vasp)
+
+    st.file_uploader("Model to extend (optional POSCAR)", key="base_poscar", help="Without a file, Extend Model adds atoms to the last model generated here")
+    if st.button('Extend Model', key="extendButton",on_click=disable, args=(False,), help="Adds the missing atoms to an existing model instead of starting from zero. The box grows to keep the density."):
+        base = baseModel(PAGE, "base_poscar")
+        if base is not None:
+            ## refused here rather than in the worker, e.g. when the model has more atoms than asked for
+            try:
+                builders.checkExtension(base, composition)
+            except ValueError as e:
+                st.error(str(e))
+                base = None
+        if base is not None:
+            st.write(f"Extending a {base.num_atoms} atom model to {sum(counts)} atoms, box length {st.session_state.box:.2f} \u212B")
+            submitJob(PAGE, builders.extendAmorphousGraphite, base, composition, st.session_state.box, cutoffs, f"{stringNumAtoms} {stringDensity}{stringLayers}extended",
+                      seed=seed, layers=layers, file_name=st.session_state.extended_vasp)
+
+    jobProgress(PAGE)
 
 with col2:
     st.header("")
@@ -161,18 +142,10 @@ with col2:
     f'<img src="https://chinonsougwumadu.com/wp-content/uploads/2024/06/ag_anime-2.gif?w=1024" width="500" alt="Amorphous Graphite Animation">',
     unsafe_allow_html=True,)
 
-    if st.session_state.generateButton:
-        st.session_state.txt1 = st.text_area("POSCAR File", f"{stringNumAtoms} {stringDensity}\n\
-{st.session_state.box:10.6f}\n\
-{1.0:2.6f} {0.0:2.6f} {0.0:2.6f}\n\
-{0.0:2.6f} {1.0:2.6f} {0.0:2.6f}\n\
-{0.0:2.6f} {0.0:2.6f} {1.0:2.6f}\n\
-C \n\
-{st.session_state.num_atoms} \n\
-Direct\n{st.session_state.final_output}")
-                                               
+    if currentModel(PAGE) is not None:
         my_anime.empty()
-        st.success('Done!')
-           
-        if st.download_button(label="Download POSCAR",key="downloadPOSCAR",data=st.session_state.txt1, file_name=st.session_state.atoms_vasp,disabled=st.session_state.get("disabled", True)):
-            st.write("Download Complete.")
+    modelOutput(PAGE, download_disabled=st.session_state.get("disabled", True))
+
+model = currentModel(PAGE)
+if model is not None:
+    modelPreview(PAGE, model)
@@ -1,10 +1,18 @@
 import streamlit as st
-import random as ran
 import numpy as np
 import pandas as pd
-import time
 import plotly
 import plotly.express as px
+from mtg import builders
+from mtg.connectivity import modelConnectivity
+from mtg.model import PoscarFile
+from mtg.porosity import modelPorosity, modelPores, extensionPoreRadii
+from mtg.seeding import generator, seededName
+from mtg.species import ATOMIC_MASS
+from mtg.store import artifactStore
+from mtg.ui import parameterForm, submitJob, jobProgress, baseModel, currentModel, modelMemo, jobMemo, cancelMemo, modelOutput, modelPreview, compositionInputs, cutoffMatrix, engineInput, seedInput
+
+PAGE = "porous_carbon"   ## key of this page's jobs and models in the session
 
 st.set_page_config(page_title="Porous Carbon", page_icon="https://chinonsougwumadu.com/wp-content/uploads/2024/05/microsoftteams-image-17.jpg")
 
@@ -32,13 +40,21 @@ def disable(b):
 
 
 ## Initialize Data
-st.sidebar.number_input("Number of Atoms:", min_value=500, step = 50, key="num_atoms",on_change=disable, args=(True,), help="The number of C atoms required")
-st.sidebar.number_input("Foam True Density [g/cm$^3$]:", min_value=0.05, value = 0.5, step = 0.05, key="density",on_change=disable, args=(True,), help ="The desired foam density")
-st.sidebar.number_input("Number of Pores:", min_value=1, value = 25, step=1, key="num_pores",on_change=disable, args=(True,), help="The number of pores required")
-st.sidebar.slider("Porosity:", min_value=0.0,max_value=1.0, value =0.5, key='porosity',on_change=disable, args=(True,), help="Desired porosity of the model")
-st.sidebar.slider("Maximum Pore Size", min_value=0.01,max_value=0.99, value =0.5, key='max_pore_size',on_change=disable, args=(True,), help="For example, 0.5 will be half the box lenght")
-st.sidebar.slider("Pore Overlap:", min_value=0.00,max_value=0.99, value =0.3, key='pore_overlap',on_change=disable, args=(True,), help="Specicy if pore overlap is allowed")
-st.sidebar.slider("Carbon Bonds Initial Cutoff [\u212B]", min_value=1.0,max_value=1.4, step = 0.1, value =1.2, key='cutoff',on_change=disable, args=(True,), help="C-C cutoff, 1.2 is ideal for optimal performance of app")
+## Parameters are batched in a form, so editing them does not rerun the page until Apply is pressed
+with parameterForm(on_submit=disable, args=(True,)):
+    st.number_input("Number of Atoms:", min_value=500, step = 50, key="num_atoms", help="The number of C atoms required")
+    ## O is left out, it marks the pores
+    species, counts = compositionInputs(st.session_state.num_atoms, dopants=["N", "B", "H"])
+    st.number_input("Foam True Density [g/cm$^3$]:", min_value=0.05, value = 0.5, step = 0.05, key="density", help ="The desired foam density")
+    st.number_input("Number of Pores:", min_value=1, value = 25, step=1, key="num_pores", help="The number of pores required")
+    st.slider("Porosity:", min_value=0.0,max_value=1.0, value =0.5, key='porosity', help="Desired porosity of the model")
+    st.slider("Maximum Pore Size", min_value=0.01,max_value=0.99, value =0.5, key='max_pore_size', help="For example, 0.5 will be half the box lenght")
+    st.slider("Pore Overlap:", min_value=0.00,max_value=0.99, value =0.3, key='pore_overlap', help="Specicy if pore overlap is allowed")
+    st.slider("Carbon Bonds Initial Cutoff [\u212B]", min_value=1.0,max_value=1.4, step = 0.1, value =1.2, key='cutoff', help="C-C cutoff, 1.2 is ideal for optimal performance of app")
+    st.toggle("Large-model mode", value=False, key="large_model", help="For multi-million atom models: positions are kept on disk as float32 and the POSCAR is written in chunks. No text preview of the full file.")
+    cutoffs = cutoffMatrix(species, st.session_state.cutoff)
+    engineInput()
+seed = seedInput(on_change=disable, args=(True,))
 
 
 # You can access the value at any point with:
@@ -49,16 +65,22 @@ st.sidebar.slider("Carbon Bonds Initial Cutoff [\u212B]", min_value=1.0,max_valu
 # st.session_state.max_pore_size
 # st.session_state.pore_overlap
 # st.session_state.cutoff
+# st.session_state.large_model
 
-st.session_state.num_atoms_arr = np.array([st.session_state.num_atoms], dtype = np.int64)
+st.session_state.species = species
+st.session_state.num_atoms_arr = np.array(counts, dtype = np.int64)
+composition = dict(zip(species, counts))
 
 ### Naming convention for saved files ##########################################################
 stringDensity = str(np.round(st.session_state.density,2)).replace(".","p")+"gcc_"
-stringNumAtoms = str(st.session_state.num_atoms)+"atoms_"
+stringNumAtoms = str(st.session_state.num_atoms)+"atoms_"+"".join(f"{n}{s}_" for s, n in zip(species[1:], counts[1:]))
 stringFoamOverlap = str(np.round(st.session_state.pore_overlap,2)).replace(".","p")+"overlap"
 stringNoFoam = str(st.session_state.num_pores)+"pores_"
+stringSeed = seededName(seed, st.session_state.engine, st.session_state.large_model)
 
-st.session_state.atoms_vasp = "POSCAR_"+stringNumAtoms+stringDensity+stringNoFoam+stringFoamOverlap
+st.session_state.atoms_vasp = "POSCAR_"+stringNumAtoms+stringDensity+stringNoFoam+stringFoamOverlap+"_"+stringSeed
+## extensions are built in memory with the cell-list engine, whatever the settings
+st.session_state.extended_vasp = "POSCAR_"+stringNumAtoms+stringDensity+stringNoFoam+stringFoamOverlap+"_extended_"+seededName(seed)
 st.session_state.pores_vasp = "POSCAR_PORES_"+stringNumAtoms+stringDensity+stringNoFoam+stringFoamOverlap
 st.session_state.atoms_and_pores_xyz = "ovito_"+stringNumAtoms+stringDensity+stringNoFoam+stringFoamOverlap+".xyz"
 #################################################################################################
@@ -71,7 +93,7 @@ def boxSize(density):
     This function predicts the box size for the porous carbon model, in units of angstrom
     '''
 
-    atom_mass_amu = np.array([12.0107])
+    atom_mass_amu = np.array([ATOMIC_MASS[s] for s in st.session_state.species])
     atom_mass_gram = [atom*1.66054e-24 for atom in atom_mass_amu]  #Convert amu to grams (1 amu = 1.66054e-24 g)
 
     total_mass = sum([atom_mass_gram[i]*st.session_state.num_atoms_arr[i] for i in range(np.size(atom_mass_gram))])
@@ -84,34 +106,35 @@ def boxSize(density):
 
 
 #def uniformPore(*, max_pore_size=st.session_state.max_pore_size_value):
-def uniformPore(max_pore_size,box):
+def uniformPore(max_pore_size,box, rng = np.random):
     '''
     This function obtains a uniform pore distribution
     The max_pore_size paramter can be changed to desired maximum pore size
+    rng is the random number generator (a numpy Generator, or the np.random module)
     '''
-    return np.random.rand() * (box*max_pore_size)
+    return rng.random() * (box*max_pore_size)
 
 
 #def chiPore(*, max_pore_size = st.session_state.max_pore_size_value , df = 1,loc = 0, scale = .25, size=1):
-def chiPore(max_pore_size, box, df = 1, size = 1):
+def chiPore(max_pore_size, box, df = 1, size = 1, rng = np.random):
     '''
     This function obtains a chi distributed pore distribution (https://en.wikipedia.org/wiki/Chi_distribution)
     The default parameter aguments are set to resemble a half-Gaussian
     The scale of .25 is set so that the maximum is around 1, to get the max allowed pore sized
     '''
-    return np.random.chisquare(df, size)[0] * (box*max_pore_size)
+    return rng.chisquare(df, size)[0] * (box*max_pore_size)
 
 
 #def betaPore(*, max_pore_size=st.session_state.max_pore_size_value , a = 4, b = 4):
-def betaPore(max_pore_size, box, a = 4, b = 4):
+def betaPore(max_pore_size, box, a = 4, b = 4, rng = np.random):
     '''
     This function obatins a beta distribution (https://en.wikipedia.org/wiki/Beta_distribution)
     The parameters, a and b, set at 4 give a non-negative bell-shaped distribution, akin to a Gaussian Distribution
     '''
-    return np.random.beta(a,b) * (box*max_pore_size)
+    return rng.beta(a,b) * (box*max_pore_size)
 
 #def poreCreator(*, porosity = st.session_state.porosity, num_pores=st.session_state.num_pores, epsilon=0.1, pore_dist_kind = 3):
-def poreCreator(max_pore_size, box, porosity, num_pores,  pore_dist_kind = 3):
+def poreCreator(max_pore_size, box, porosity, num_pores,  pore_dist_kind = 3, rng = np.random):
 
     '''
     This function creates the pores in a desired distribution and porosity
@@ -120,6 +143,7 @@ def poreCreator(max_pore_size, box, porosity, num_pores,  pore_dist_kind = 3):
     num_pores is the number of pores you want to sample
     epsilon ensures that we select a distribution that is less the desired porosity. We set this to 0.1
     pore_dist_kind specify what pore distribution is preffered example 3 (default) is the beta distribution
+    rng is the random number generator the radii are drawn from
     '''
     epsilon=0.1
     poreRadii_list = []
@@ -135,15 +159,15 @@ def poreCreator(max_pore_size, box, porosity, num_pores,  pore_dist_kind = 3):
             
             if pore_dist_kind == 1:
                 name = "Beta Distribution"
-                pore_radius = betaPore(max_pore_size,box)
+                pore_radius = betaPore(max_pore_size,box,rng=rng)
                 
             elif pore_dist_kind == 2:
                 name = "Uniform Distribution"
-                pore_radius = uniformPore(max_pore_size,box)
+                pore_radius = uniformPore(max_pore_size,box,rng=rng)
                 
             else:
                 name = "Chi Distribution"
-                pore_radius = chiPore(max_pore_size,box)
+                pore_radius = chiPore(max_pore_size,box,rng=rng)
 
             
             poreVolume_sum += pore_radius**3/box**3
@@ -182,6 +206,57 @@ def poreCreator(max_pore_size, box, porosity, num_pores,  pore_dist_kind = 3):
     print(np.round(poreRadii_list,2))
     
     return name, poreRadii_list
+
+
+def achievedPorosity(model):
+    '''
+    Monte-Carlo estimate of the void the pores leave, with overlap and periodic wrapping, and the volume of every pore
+    '''
+    if isinstance(model, PoscarFile):
+        model = model.sample
+    with st.expander("Achieved porosity"):
+        ## fixed rng so it does not flicker, and worked out once per model
+        est = modelMemo(PAGE, "porosity", lambda: modelPorosity(model, rng=np.random.default_rng(0)))
+        st.write(f"Void fraction: **{est['porosity']:.4f} \u00B1 {est['porosity_err']:.4f}**")
+        st.caption(f"Sum of r\u00B3/box\u00B3 (the porosity the pore radii were drawn for): {est['nominal']:.3f}. "
+                   f"Sum of the sphere volumes over the box volume: {est['spheres']:.3f}.")
+        radii = model.extras["pore_radii"]
+        st.dataframe(pd.DataFrame({"Radius [\u212B]": radii, "Volume [\u212B\u00B3]": est["pore_volume"], "\u00B1 ": est["pore_volume_err"],
+                                   "Overlap [\u212B\u00B3]": est["overlap_volume"], "\u00B1": est["overlap_volume_err"],
+                                   "Overlap [%]": 100 * est["overlap_volume"] / np.maximum(est["pore_volume"], 1e-12)}).round(2),
+                     use_container_width=True)
+
+
+def poreConnectivity(model):
+    '''
+    Whether the pores percolate, the cluster sizes of the pore space, and the surface a probe molecule can reach
+    '''
+    if isinstance(model, PoscarFile):
+        model = model.sample
+    with st.expander("Pore connectivity"):
+        ## the body of an expander runs even while it is collapsed, so the analysis waits for the toggle
+        if not st.toggle("Analyse connectivity", key="connectivity_on", help="Runs the analysis below for this model and these settings"):
+            cancelMemo(PAGE, "connectivity")
+            return
+        c1, c2 = st.columns(2)
+        grid = c1.select_slider("Grid", options=[64, 128, 192, 256], value=128, key="connectivity_grid",
+                                help="Voxels per box edge. Finer grids take longer: a few seconds per CPU at 256")
+        probe = c2.number_input("Probe radius [\u212B]", min_value=0.0, max_value=10.0, value=0.0, step=0.1, key="connectivity_probe",
+                                help="Radius of the molecule rolled through the pores, e.g. 1.3 \u212B for N\u2082. 0 analyses the bare pore space")
+        ## worked out in a worker process, like the models, so the page stays responsive meanwhile
+        con = jobMemo(PAGE, "connectivity", modelConnectivity, model, grid, probe, key=(grid, probe))
+        if con is None:
+            return
+        st.write(f"Percolates along x, y, z: **{', '.join('yes' if p else 'no' for p in con['percolates'])}** "
+                 f"({100 * con['percolating_fraction']:.1f}% of the accessible pore space is in percolating clusters)")
+        st.write(f"Accessible pore volume fraction: **{con['accessible_fraction']:.4f}** of {con['void_fraction']:.4f}")
+        st.write(f"Accessible surface area: **{con['accessible_area']:.0f} \u212B\u00B2** of {con['surface_area']:.0f} \u212B\u00B2 of pore walls")
+        st.dataframe(pd.DataFrame({"Cluster volume [\u212B\u00B3]": con["cluster_volumes"]}).round(1), use_container_width=True, height=200)
+
+
+def poreAnalysis(model):
+    achievedPorosity(model)
+    poreConnectivity(model)
 ##########################################################################################################
 
 
@@ -198,20 +273,24 @@ with col1:
     
     if st.button('Create Pores',key="createButton",on_click=disable, args=(False,)):
         st.session_state.box, volume = boxSize(st.session_state.density)
-        st.session_state.name, st.session_state.poreRadii_list = poreCreator(st.session_state.max_pore_size, st.session_state.box, st.session_state.porosity, st.session_state.num_pores, pore_dist_kind)
+        st.session_state.name, poreRadii_list = poreCreator(st.session_state.max_pore_size, st.session_state.box, st.session_state.porosity, st.session_state.num_pores, pore_dist_kind,
+                                                                  rng=generator(seed, "pore radii"))
+        ## The session only keeps a handle, the radii live in the store shared by all sessions
+        artifactStore().drop(st.session_state.get("pores_handle"))
+        st.session_state.pores_handle = artifactStore().put(np.asarray(poreRadii_list))
 
         #prints
         st.write(f"The box lenght is {st.session_state.box:.2f} \u212B")
         st.write(f"Pore Distribution: {st.session_state.name}")
-        st.text(f"Pore Radii List:\n {np.round(st.session_state.poreRadii_list, 2)}")
+        st.text(f"Pore Radii List:\n {np.round(poreRadii_list, 2)}")
         
         # Create distplot with custom bin_size
 
-        st.session_state.df = pd.DataFrame(st.session_state.poreRadii_list, columns=["Pore Size"])
+        df = pd.DataFrame(poreRadii_list, columns=["Pore Size"])
         
-        st.session_state.fig_poreDistro = px.histogram(st.session_state.df, x = "Pore Size", nbins=int(st.session_state.num_pores/2))
+        fig_poreDistro = px.histogram(df, x = "Pore Size", nbins=int(st.session_state.num_pores/2))
         # Plot!
-        st.plotly_chart(st.session_state.fig_poreDistro, use_container_width=True,theme="streamlit")
+        st.plotly_chart(fig_poreDistro, use_container_width=True,theme="streamlit")
 
         
         
@@ -219,135 +298,54 @@ with col2:
     st.header("Generate Model")
 
     if st.button('Generate Model', key="generateButton",disabled=st.session_state.get("disabled", True)):
+        poreRadii_list = artifactStore().get(st.session_state.pores_handle)
+        if poreRadii_list is None:
+            st.warning("The pore distribution has expired from the server, please create the pores again.")
+            st.stop()
+
         with col1:
             st.write(f"The box lenght is {st.session_state.box:.2f} \u212B")
             st.write(f"Pore Distribution: {st.session_state.name}")
-            st.text(f"Pore Radii List:\n {np.round(st.session_state.poreRadii_list, 2)}")
+            st.text(f"Pore Radii List:\n {np.round(poreRadii_list, 2)}")
             # Create distplot with custom bin_size
 
-            st.plotly_chart(st.session_state.fig_poreDistro, use_container_width=True ,theme="streamlit")
-
-
-        ######################## Carbon foam constructor Algorithm starts here ####################################################
-
-        pos = np.zeros([st.session_state.num_atoms+st.session_state.num_pores,3],float)   ## A list that takes in the position of the atoms and pores
-
-        #st.write(f"Number of pores and atoms: {np.shape(pos)[0]} in {np.shape(pos)[1]} dimensions")
-        
-        box = st.session_state.box
-        pore_overlap = st.session_state.pore_overlap
-        poreRadii_list = st.session_state.poreRadii_list
-        num_pores = st.session_state.num_pores
-        num_atoms = st.session_state.num_atoms
-        cutoff = st.session_state.cutoff
-
-        ct = 0
-        rnd = lambda i: i-round(i/box)*box  ## This makes rnd a function that takes i and perform i - round(i/box)*box
-        vec_rnd = np.vectorize(rnd)         ## takes  a function and gives result in a callable vectorised function
-
-        print ("Now creating the center of the foams")
-
-        while ct < num_pores:
-
-            center =np.array([box*ran.random(),box*ran.random(),box*ran.random()])
-            test = 0
-            while test < ct:
-                pore_distance = center-pos[test][:]
-                pore_distance = vec_rnd(pore_distance)
-
-                if sum(map(lambda i: i*i, pore_distance)) < (pore_overlap*poreRadii_list[test])**2:
-                    center =np.array([box*ran.random(),box*ran.random(),box*ran.random()])
-                    test = 0
-                else:
-                    test +=1 
-           
-            pos[ct][:] = center[:]
-        
-            ct += 1
-    
-      
-        st.write("ALL PORES CREATED")
-
-        ### Uncomment for debugging
-        #print(pos[:num_pores])
-        ###########################
-
-        print()
-        with st.spinner("Creating carbon atoms. Takes time, please wait.)"):
-            my_bar = st.progress(0, text="Progress Status.")
-
-            while ct < num_atoms+num_pores:
-                atoms =[box*ran.random(),box*ran.random(),box*ran.random()]
-                test = 0
-    
-                ### Uncomment for debugging
-                #print (atoms-pos[test][:])
-                ###########################
-    
-                while test < ct:
-                    atom_distance = atoms-pos[test][:]
-                    atom_distance = vec_rnd(atom_distance)
-        
-                    # Make sure atoms are not close to the pore center
-                    if test < num_pores-1 and sum(map(lambda i: i*i, atom_distance)) < poreRadii_list[test]**2:
-                        atoms =np.array([box*ran.random(),box*ran.random(),box*ran.random()])
-            
-                        ### Uncomment for debugging##################
-                        #print ("OOPS!!! TOO CLOSE to a foam center")
-                        #############################################
-                        test = 0 
-            
-                    ### Position the atoms if atoms are not close to center    
-                    elif sum(map(lambda i: i*i, atom_distance)) < cutoff**2 and test >= num_pores:
-                        atoms =np.array([box*ran.random(),box*ran.random(),box*ran.random()])
-                        
-                        ### Uncomment for debugging##################
-                        #print ("OOPS!!! TOO CLOSE to a foam center")
-                        #############################################
-            
-                        test = 0
-                    else:
-                        test += 1
-            
-                pos[ct][:] = atoms
-    
-    
-                ct +=1
-                my_bar.progress(ct/(num_atoms+num_pores), text="Progress Status.")         
-                print (f"Placing Atom number {ct-num_pores} of {num_atoms}", end='\r')
-         ################################################################################################
-
-        my_bar.empty()
-        with st.spinner("Preparing file for download. Please wait..."):
-            time.sleep(5)
-
-    
-        atom_position = pos/st.session_state.box
-
-        #Convert the NumPy array to a list of lists
-        list_of_lists = atom_position.tolist()
-
-        #Convert each sublist to a string with elements separated by spaces
-        lines = [" ".join(map(str, sublist)) for sublist in list_of_lists]
-
-        #Join the resulting lines with newline characters
-        final_output = "\n".join(lines)
-
-        st.session_state.txt1 = st.text_area("POSCAR File", f"{stringNumAtoms} {stringDensity} {stringNoFoam} {stringFoamOverlap}\n\
-{st.session_state.box:10.6f}\n\
-{1.0:2.6f} {0.0:2.6f} {0.0:2.6f}\n\
-{0.0:2.6f} {1.0:2.6f} {0.0:2.6f}\n\
-{0.0:2.6f} {0.0:2.6f} {1.0:2.6f}\n\
-O     C \n\
-{st.session_state.num_pores}   {st.session_state.num_atoms} \n\
-Direct\n{final_output}")
-                                               
-
-
-        st.success('Done!')
-        st.info('IMPORTANT! The pores are represented by oxygen (O) in the POTCAR file below.', icon="ℹ️")
+            df = pd.DataFrame(poreRadii_list, columns=["Pore Size"])
+            fig_poreDistro = px.histogram(df, x = "Pore Size", nbins=int(st.session_state.num_pores/2))
+            st.plotly_chart(fig_poreDistro, use_container_width=True ,theme="streamlit")
+
+
+        ## The model is built in a worker process, so this session (and everyone else's) stays responsive
+        submitJob(PAGE, builders.porousCarbon, composition, st.session_state.num_pores, st.session_state.box, cutoffs, st.session_state.pore_overlap, poreRadii_list,
+                  f"{stringNumAtoms} {stringDensity} {stringNoFoam} {stringFoamOverlap}", large=st.session_state.large_model, engine=st.session_state.engine, seed=seed,
+                  file_name=st.session_state.atoms_vasp)
+
+    st.file_uploader("Model to extend (optional POSCAR)", key="base_poscar", help="Pore centers written as O ahead of the atoms, as this page writes them. "
+                     "Without a file, Extend Model adds to the last model generated here")
+    if st.button('Extend Model', key="extendButton", help="Adds atoms (and pores, if Number of Pores went up) to the last model instead of starting from zero. The box grows to keep the density."):
+        base = baseModel(PAGE, "base_poscar")
+        if base is not None and base.species[0] != "O":
+            st.error("This model has no pores. Porous carbon POSCAR files list the pore centers as O, ahead of the atoms.")
+        elif base is not None:
+            box, volume = boxSize(st.session_state.density)
+            pore_sampler = {1: betaPore, 2: uniformPore}.get(pore_dist_kind, chiPore)
+            pore_rng = generator(seed, "extend pore radii", base.num_atoms)   # not the radii Create Pores drew
+            ## refused here rather than in the worker: too many atoms in the model, or no porosity left for the new pores
+            try:
+                builders.checkExtension(base, composition, skip=1)
+                new_pore_radii = extensionPoreRadii(modelPores(base)[1] * box / base.box[0], box, st.session_state.porosity,
+                                                    max(st.session_state.num_pores - base.counts[0], 0),
+                                                    lambda: pore_sampler(st.session_state.max_pore_size, box, rng=pore_rng))
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.write(f"Extending the model to {sum(counts)} atoms and {base.counts[0] + len(new_pore_radii)} pores, box length {box:.2f} \u212B")
+                submitJob(PAGE, builders.extendPorousCarbon, base, composition, box, cutoffs, st.session_state.pore_overlap, new_pore_radii,
+                          f"{stringNumAtoms} {stringDensity} {stringNoFoam} {stringFoamOverlap} extended", seed=seed, file_name=st.session_state.extended_vasp)
 
-        if st.download_button(label="Download POSCAR",data=st.session_state.txt1, file_name=st.session_state.atoms_vasp,on_click=disable, args=(True,)):
-            st.write("Download Complete.")
+    jobProgress(PAGE)
 
+    modelOutput(PAGE, on_download=disable, args=(True,), notice="IMPORTANT! The pores are represented by oxygen (O) in the POTCAR file below.", details=poreAnalysis)
 
+model = currentModel(PAGE)
+if model is not None:
+    modelPreview(PAGE, model)
@@ -0,0 +1,137 @@
+import time
+import numpy as np
+from streamlit.testing.v1 import AppTest
+from mtg.connectivity import labelClusters, poreConnectivity
+
+N = 8
+
+
+def _grid(voxels):
+    mask = np.zeros((N, N, N), dtype=bool)
+    mask[tuple(np.array(voxels).T)] = True
+    return mask
+
+
+def test_straight_chain_percolates_along_its_axis_only():
+    labels, sizes, wraps = labelClusters(_grid([(i, 2, 5) for i in range(N)]))
+    assert list(sizes) == [N]
+    assert wraps.tolist() == [[True, False, False]]
+    assert np.count_nonzero(labels >= 0) == N
+
+
+def test_broken_chain_does_not_percolate():
+    labels, sizes, wraps = labelClusters(_grid([(i, 2, 5) for i in range(N) if i != 4]))
+    assert list(sizes) == [N - 1]   # still one cluster, joined across the x face
+    assert not wraps.any()
+
+
+def test_diagonal_staircase_percolates_across_the_periodic_faces():
+    ## (i, i) -> (i+1, i) -> (i+1, i+1): 6-connected steps that cross the x and the y face once each
+    steps = [(i, i, 0) for i in range(N)] + [((i + 1) % N, i, 0) for i in range(N)]
+    labels, sizes, wraps = labelClusters(_grid(steps))
+    assert list(sizes) == [2 * N]
+    assert wraps.tolist() == [[True, True, False]]
+
+
+def test_diagonal_touching_only_at_edges_is_not_connected():
+    ## voxels that share only an edge are not 6-connected
+    labels, sizes, wraps = labelClusters(_grid([(i, i, 0) for i in range(N)]))
+    assert sorted(sizes) == [1] * N
+    assert not wraps.any()
+
+
+def test_isolated_blobs():
+    mask = np.zeros((N, N, N), dtype=bool)
+    mask[1:3, 1:3, 1:3] = True
+    mask[5:7, 5:7, 4:7] = True
+    labels, sizes, wraps = labelClusters(mask)
+    assert sorted(sizes) == [8, 12]
+    assert not wraps.any()
+    assert labels[1, 1, 1] != labels[5, 5, 5]
+    assert np.all(labels[~mask] == -1)
+
+
+def test_slab_percolates_in_plane():
+    mask = np.zeros((N, N, N), dtype=bool)
+    mask[:, :, 3] = True
+    _, sizes, wraps = labelClusters(mask)
+    assert list(sizes) == [N * N]
+    assert wraps.tolist() == [[True, True, False]]
+
+
+def _floodFill(mask):
+    ## periodic 6-connected clusters, one voxel at a time
+    labels = np.full(mask.shape, -1)
+    count = 0
+    for start in zip(*np.nonzero(mask)):
+        if labels[start] >= 0:
+            continue
+        labels[start] = count
+        stack = [start]
+        while stack:
+            voxel = stack.pop()
+            for k in range(3):
+                for step in (-1, 1):
+                    v = list(voxel)
+                    v[k] = (v[k] + step) % mask.shape[k]
+                    v = tuple(v)
+                    if mask[v] and labels[v] < 0:
+                        labels[v] = count
+                        stack.append(v)
+        count += 1
+    return labels
+
+
+def test_random_grid_matches_a_flood_fill():
+    mask = np.random.default_rng(0).random((12, 10, 9)) < 0.3   # near the percolation threshold: many branched clusters
+    labels, sizes, _ = labelClusters(mask)
+    expected = _floodFill(mask)
+    assert np.array_equal(labels < 0, expected < 0)
+    pairs = np.unique(np.stack([labels[mask], expected[mask]], axis=1), axis=0)
+    assert len(pairs) == len(sizes) == expected.max() + 1 == len(np.unique(pairs[:, 0])) == len(np.unique(pairs[:, 1]))
+    assert np.array_equal(np.bincount(labels[mask]), sizes)
+
+
+def test_overlapping_pore_chain_percolates():
+    box = 12.0
+    centers = [(x, 6.0, 6.0) for x in (0.0, 3.0, 6.0, 9.0)]
+    result = poreConnectivity(centers, [2.0] * 4, box, grid=48)
+    assert result["percolates"].tolist() == [True, False, False]
+    assert result["percolating_fraction"] == 1.0
+    ## a probe wider than the necks between the pores cannot pass through them
+    result = poreConnectivity(centers, [2.0] * 4, box, grid=48, probe=1.6)
+    assert not result["percolates"].any()
+
+
+def _analysisPage():
+    import numpy as np
+    import streamlit as st
+    from mtg import builders
+    from mtg.connectivity import modelConnectivity
+    from mtg.ui import serveModel, currentModel, jobMemo, cancelMemo
+    if "served" not in st.session_state:
+        serveModel("test_page", builders.porousCarbon({"C": 300}, 3, 15.0, 1.2, 0.3, np.full(3, 3.0), "test", seed=1), "POSCAR_test")
+        st.session_state.served = True
+    ## like the porous carbon page, nothing starts until the toggle is on
+    if not st.toggle("Analyse connectivity", key="connectivity_on"):
+        cancelMemo("test_page", "connectivity")
+        st.write("off")
+        return
+    con = jobMemo("test_page", "connectivity", modelConnectivity, currentModel("test_page"), 32, 0.0, key=(32, 0.0))
+    st.write("pending" if con is None else f"void {con['void_fraction']:.6f}")
+
+
+def test_connectivity_runs_in_a_worker():
+    app = AppTest.from_function(_analysisPage, default_timeout=60)
+    app.run()
+    assert app.markdown[0].value == "off"
+    assert app.session_state["test_page_connectivity_memo_job"]["job_id"] is None
+    app.toggle(key="connectivity_on").set_value(True).run()
+    assert app.markdown[0].value == "pending"   # the script thread does not wait for it
+    for _ in range(60):
+        time.sleep(0.5)
+        app.run()
+        assert not app.exception
+        if app.markdown[0].value != "pending":
+            break
+    assert app.markdown[0].value.startswith("void 0.")
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from mtg import builders
+from mtg.placement import CellList, minimumImage
+from mtg.porosity import extensionPoreRadii, modelPores
+from mtg.species import atomMassGram
+
+CUTOFF = 1.2
+DENSITY = 2.44
+
+
+def _boxLength(num_atoms, density=DENSITY):
+    return (atomMassGram(["C"])[0] * num_atoms / density)**(1/3) / 1e-8
+
+
+def _nearestNeighbour(pos, rows, box, reach=3.0):
+    '''
+    Periodic distance from each of the given rows to its nearest other atom
+    '''
+    cells = CellList(box, reach)
+    cells.insert(np.arange(len(pos), dtype=np.int32), pos)
+    nb = cells.neighbours(pos[rows])
+    valid = (nb >= 0) & (nb != rows[:, None])
+    d = minimumImage(pos[np.where(valid, nb, 0)] - pos[rows][:, None, :], box)
+    return np.sqrt(np.where(valid, np.einsum("ijk,ijk->ij", d, d), np.inf).min(axis=1))
+
+
+def _closeShare(seed, extend_seed):
+    model = builders.amorphousGraphite({"C": 3000}, _boxLength(3000), CUTOFF, "test", seed=seed)
+    box = _boxLength(3300)
+    extended = builders.extendAmorphousGraphite(model, {"C": 3300}, box, CUTOFF, "test", seed=extend_seed)
+    pos = extended.frac.astype(np.float64) * box
+    assert np.allclose(pos[:3000], model.frac * box, atol=1e-4)   # carbon only, so the existing atoms keep their rows
+    nn = _nearestNeighbour(pos, np.arange(3000, 3300), box)
+    assert nn.min() >= CUTOFF * (1 - 1e-6)
+    return np.mean(nn < 1.25)
+
+
+def test_extension_with_the_build_seed_does_not_replay_its_draws():
+    ## replayed candidates would land on the earlier atoms and pile the kept ones up just outside the cutoff
+    same, other = _closeShare(7, 7), _closeShare(7, 8)
+    assert same < 0.3
+    assert abs(same - other) < 0.1
+
+
+
+def _porousModel(box=27.1, porosity=0.1):
+    ## three equal pores making up the porosity, as poreCreator aims it (sum of r**3/box**3)
+    radii = np.full(3, (porosity / 3)**(1/3) * box)
+    return builders.porousCarbon({"C": 500}, 3, box, CUTOFF, 0.3, radii, "test", seed=9)
+
+
+def test_extension_pores_stay_within_the_porosity():
+    model, box = _porousModel(), 27.1
+    draws = iter([0.9 * box, 12.0, 3.0])   # chi radii can be as big as the box: too big for what is left, drawn again
+    radii = extensionPoreRadii(modelPores(model)[1], box, 0.15, 2, lambda: next(draws))
+    assert radii[0] == 3.0
+    assert np.sum(np.r_[modelPores(model)[1], radii]**3) / box**3 == pytest.approx(0.15)
+
+    extended = builders.extendPorousCarbon(model, {"C": 550}, box, CUTOFF, 0.3, radii, "test", seed=9)
+    assert extended.counts == [5, 550]
+    centers, all_radii = modelPores(extended)
+    atoms = extended.frac[5:].astype(np.float64) * box
+    d = minimumImage(atoms[:, None, :] - centers[None, :, :], box)
+    assert np.all(np.sqrt(np.sum(d**2, axis=2)) >= all_radii[None, :])
+    assert _nearestNeighbour(atoms, np.arange(len(atoms)), box).min() >= CUTOFF * (1 - 1e-6)
+
+
+def test_extension_pores_need_porosity_left():
+    model = _porousModel()
+    with pytest.raises(ValueError, match="already take up the porosity"):
+        extensionPoreRadii(modelPores(model)[1], 27.1, 0.08, 1, lambda: 3.0)
+    with pytest.raises(ValueError, match="Could not draw"):
+        extensionPoreRadii(modelPores(model)[1], 27.1, 0.12, 3, lambda: 10.0)
+    assert len(extensionPoreRadii(modelPores(model)[1], 27.1, 0.12, 0, lambda: 3.0)) == 0
+
+
+def test_extension_with_fewer_atoms_is_refused_before_it_is_submitted():
+    model = _porousModel()
+    with pytest.raises(ValueError, match="more atoms than requested"):
+        builders.checkExtension(model, {"C": 400}, skip=1)
+    with pytest.raises(ValueError, match="not in the composition"):
+        builders.checkExtension(model, {"N": 600})
+    builders.checkExtension(model, {"C": 600}, skip=1)
@@ -0,0 +1,119 @@
+import os
+import time
+import pytest
+from mtg.jobs import JobScheduler, QueueFull, UserLimitReached
+
+
+class _Result:
+    '''
+    A job result that leaves a file behind when it is released, like mtg.model.PoscarFile deletes its file
+    '''
+
+    def __init__(self, path):
+        self.path = path
+
+    def release(self):
+        open(self.path + ".released", "w").close()
+
+
+def _gatedJob(gate, progress):
+    '''
+    Runs until the file gate exists, so the tests decide when a job finishes
+    '''
+    progress(0.5)
+    deadline = time.monotonic() + 60
+    while not os.path.exists(gate) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return _Result(gate)
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    schedulers = []
+    def make(**limits):
+        schedulers.append(JobScheduler(**limits))
+        return schedulers[-1]
+    yield make
+    for path in ["a", "b", "c", "d"]:
+        open(tmp_path / path, "w").close()
+    for s in schedulers:
+        if s._executor is not None:
+            s._executor.shutdown(wait=True)
+
+
+def _waitFor(scheduler, job_id, states=("done", "failed", "unknown")):
+    deadline = time.monotonic() + 60
+    while scheduler.status(job_id)[0] not in states and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return scheduler.status(job_id)
+
+
+def test_job_runs_and_reports_progress(scheduler, tmp_path):
+    s = scheduler(max_workers=1)
+    job = s.submit("u", _gatedJob, str(tmp_path / "a"))
+    deadline = time.monotonic() + 60
+    while s.status(job) != ("running", 0.5) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert s.status(job) == ("running", 0.5)
+    open(tmp_path / "a", "w").close()
+    assert _waitFor(s, job) == ("done", None)
+    assert s.result(job).path == str(tmp_path / "a")
+    assert s.status(job) == ("unknown", None)   # collected
+
+
+def test_queue_position_and_bound(scheduler, tmp_path):
+    s = scheduler(max_workers=1, max_queued=2, max_per_user=10)
+    running = s.submit("u", _gatedJob, str(tmp_path / "a"))
+    first, second = s.submit("u", _gatedJob, str(tmp_path / "b")), s.submit("u", _gatedJob, str(tmp_path / "c"))
+    assert s.status(running)[0] == "running"
+    assert s.status(first) == ("queued", 1) and s.status(second) == ("queued", 2)
+    with pytest.raises(QueueFull):
+        s.submit("v", _gatedJob, str(tmp_path / "d"))
+    s.cancel(first)
+    assert s.status(second) == ("queued", 1)
+
+
+def test_per_user_limit(scheduler, tmp_path):
+    s = scheduler(max_workers=1, max_per_user=2)
+    s.submit("u", _gatedJob, str(tmp_path / "a"))
+    s.submit("u", _gatedJob, str(tmp_path / "b"))
+    with pytest.raises(UserLimitReached):
+        s.submit("u", _gatedJob, str(tmp_path / "c"))
+    s.submit("v", _gatedJob, str(tmp_path / "c"))   # other users are not affected
+
+
+def test_cancelled_running_job_counts_until_it_finishes_and_its_result_is_released(scheduler, tmp_path):
+    s = scheduler(max_workers=1, max_per_user=1)
+    job = s.submit("u", _gatedJob, str(tmp_path / "a"))
+    _waitFor(s, job, ("running",))
+    s.cancel(job)
+    assert s.status(job) == ("unknown", None)
+    with pytest.raises(UserLimitReached):
+        s.submit("u", _gatedJob, str(tmp_path / "b"))
+
+    open(tmp_path / "a", "w").close()
+    deadline = time.monotonic() + 60
+    while not os.path.exists(tmp_path / "a.released") and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert os.path.exists(tmp_path / "a.released")
+    s.submit("u", _gatedJob, str(tmp_path / "b"))
+
+
+def test_replacing_jobs_never_loses_the_last_one(scheduler, tmp_path):
+    ## submit A, then B and C each replacing the one before: C is accepted, A and B are cancelled
+    s = scheduler(max_workers=2, max_per_user=2)
+    a = s.submit("u", _gatedJob, str(tmp_path / "a"))
+    b = s.submit("u", _gatedJob, str(tmp_path / "b"), replaces=a)
+    _waitFor(s, b, ("running",))
+    c = s.submit("u", _gatedJob, str(tmp_path / "c"), replaces=b)
+    assert s.status(a)[0] == s.status(b)[0] == "unknown"
+    assert s.status(c)[0] in ("queued", "running")
+
+    ## a refused job leaves the one it would have replaced alone
+    with pytest.raises(UserLimitReached):
+        s.submit("u", _gatedJob, str(tmp_path / "d"), replaces=c)
+    assert s.status(c)[0] in ("queued", "running")
+
+    for path in ["a", "b", "c"]:
+        open(tmp_path / path, "w").close()
+    assert _waitFor(s, c) == ("done", None)
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+import pytest
+from mtg.placement import CellList, placeAtoms, positionArray, releasePositions, minimumImage
+from mtg.templates import minimumDistance
+
+CUTOFF = 1.2
+BOX = 12.0
+
+
+def test_atoms_keep_the_cutoff():
+    pos = placeAtoms(np.zeros((400, 3)), BOX, CUTOFF, rng=np.random.default_rng(0))
+    assert np.all((pos >= 0) & (pos < BOX))
+    assert minimumDistance(pos, BOX, CUTOFF) >= CUTOFF
+
+
+def test_atoms_stay_out_of_the_pores():
+    ## one pore across the periodic corner of the box, one in the middle
+    centers = np.array([[0.5, 0.5, 0.5], [6.0, 6.0, 6.0]])
+    radii = np.array([3.0, 2.5])
+    pos = placeAtoms(np.zeros((400, 3)), BOX, CUTOFF, pore_centers=centers, pore_radii=radii, rng=np.random.default_rng(1))
+    d = minimumImage(pos[:, None, :] - centers[None, :, :], BOX)
+    assert np.all(np.sqrt(np.sum(d**2, axis=2)) >= radii[None, :])
+    assert minimumDistance(pos, BOX, CUTOFF) >= CUTOFF
+
+
+def test_extension_keeps_the_placed_atoms():
+    pos = np.zeros((400, 3))
+    placeAtoms(pos[:200], BOX, CUTOFF, rng=np.random.default_rng(2))
+    placed = pos[:200].copy()
+    placeAtoms(pos, BOX, CUTOFF, start=200, rng=np.random.default_rng(3))
+    assert np.array_equal(pos[:200], placed)
+    assert minimumDistance(pos, BOX, CUTOFF) >= CUTOFF
+
+
+def test_progress_reaches_one():
+    done = []
+    placeAtoms(np.zeros((300, 3)), BOX, CUTOFF, batch=64, rng=np.random.default_rng(4), progress=done.append)
+    assert done == sorted(done) and done[-1] == 1.0
+
+
+def test_full_box_raises():
+    ## far more atoms than fit in a 2 angstrom box at this cutoff
+    with pytest.raises(RuntimeError, match="too full"):
+        placeAtoms(np.zeros((50, 3)), 2.0, CUTOFF, batch=8, rng=np.random.default_rng(5))
+
+
+def test_cell_list_grows_when_a_cell_overflows():
+    cells = CellList(BOX, 4.0, capacity=2)
+    xyz = np.full((5, 3), 1.0) + np.arange(5)[:, None] * 0.1   # all in cell (0, 0, 0)
+    cells.insert(np.arange(5, dtype=np.int32), xyz)
+    assert cells.table.shape[1] >= 5
+    assert cells.count[0] == 5
+    found = cells.neighbours(np.array([[1.0, 1.0, 1.0]]))[0]
+    assert sorted(found[found >= 0]) == [0, 1, 2, 3, 4]
+
+
+def test_cell_list_rejects_more_atoms_than_a_cell_can_count():
+    cells = CellList(BOX, 4.0)
+    with pytest.raises(RuntimeError, match="Too many atoms in one cell"):
+        cells.insert(np.arange(300, dtype=np.int32), np.full((300, 3), 1.0))
+
+
+def test_large_mode_matches_in_memory_placement():
+    pos = placeAtoms(np.zeros((500, 3)), BOX, CUTOFF, rng=np.random.default_rng(6))
+    large = positionArray(500, large=True)
+    try:
+        assert isinstance(large, np.memmap) and large.dtype == np.float32
+        placeAtoms(large, BOX, CUTOFF, rng=np.random.default_rng(6))
+        assert np.allclose(large, pos, atol=1e-5)
+    finally:
+        releasePositions(large)
+    assert not os.path.exists(large.filename)
@@ -0,0 +1,38 @@
+import contextlib
+import io
+import numpy as np
+import pytest
+from mtg import builders
+from mtg.model import Model
+from mtg.placement import minimumImage
+from mtg.porosity import modelPores
+
+
+def _porousModel(engine):
+    with contextlib.redirect_stdout(io.StringIO()):   # the reference loop prints every atom
+        return builders.porousCarbon({"C": 300}, 3, 15.0, 1.2, 0.3, np.full(3, 3.0), "test", engine=engine, seed=1)
+
+
+def _poreClearance(model, centers, radii):
+    '''
+    Distance of every atom to the nearest pore surface (negative inside a pore)
+    '''
+    atoms = model.frac[model.counts[0]:] * model.box
+    d = minimumImage(atoms[:, None, :] - centers[None, :, :], model.box)
+    return (np.sqrt(np.sum(d**2, axis=2)) - radii[None, :]).min(axis=1)
+
+
+@pytest.mark.parametrize("engine", ["cell-list", "reference"])
+def test_atoms_stay_out_of_the_analysed_pores(engine):
+    model = _porousModel(engine)
+    centers, radii = modelPores(model)
+    assert len(centers) == len(radii) == 3
+    assert _poreClearance(model, centers, radii).min() >= 0
+
+
+def test_uploaded_model_pores_are_free_of_atoms():
+    model = _porousModel("cell-list")
+    upload = Model.fromPoscar(model.poscarText())
+    centers, radii = modelPores(upload)
+    assert np.all(radii >= model.extras["pore_radii"])
+    assert _poreClearance(upload, centers, radii).min() >= 0
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+import plotly.graph_objects as go
+from mtg import builders
+from mtg.porosity import modelPores
+from mtg.preview import decimate, previewFigure
+
+
+@pytest.mark.parametrize("method", ["stratified", "random"])
+def test_decimate_keeps_at_most_budget_unique_rows(method):
+    points = np.random.default_rng(0).random((5000, 3)) * 20
+    picked = decimate(points, 700, method, np.random.default_rng(1))
+    assert len(picked) == 700 == len(np.unique(picked))
+    assert picked.min() >= 0 and picked.max() < 5000
+    assert np.array_equal(decimate(points[:300], 700, method), np.arange(300))   # under budget, everything is drawn
+
+
+def test_stratified_covers_sparse_regions_better_than_random():
+    rng = np.random.default_rng(2)
+    ## a dense clump in one corner and a thin spread over the rest of the box
+    points = np.concatenate([rng.random((20000, 3)) * 2, 2 + rng.random((1000, 3)) * 18])
+    sparse = lambda picked: np.count_nonzero(picked >= 20000)
+    stratified = decimate(points, 1000, "stratified", np.random.default_rng(3))
+    random = decimate(points, 1000, "random", np.random.default_rng(3))
+    assert sparse(stratified) > 3 * sparse(random)
+
+
+def test_porous_preview_draws_pores_as_spheres():
+    radii = np.array([3.0, 2.5, 2.0])
+    model = builders.porousCarbon({"C": 300}, 3, 15.0, 1.2, 0.3, radii, "test", seed=4)
+    fig = previewFigure(model, budget=100)
+
+    points = [t for t in fig.data if isinstance(t, go.Scatter3d)]
+    meshes = [t for t in fig.data if isinstance(t, go.Mesh3d)]
+    assert [t.name for t in points] == ["C (100 shown)"]   # no O points for the pore centers
+    assert len(meshes) == 1 and meshes[0].name == "Pores (3)"
+
+    ## every mesh vertex lies on the surface of one of the pores
+    vertices = np.stack([meshes[0].x, meshes[0].y, meshes[0].z], axis=1)
+    centers, radii = modelPores(model)
+    on_surface = np.isclose(np.linalg.norm(vertices[:, None, :] - centers[None, :, :], axis=2), radii[None, :])
+    assert np.all(on_surface.sum(axis=1) >= 1)
+    assert np.all(on_surface.any(axis=0))
@@ -0,0 +1,91 @@
+import contextlib
+import io
+import numpy as np
+import pytest
+from streamlit.testing.v1 import AppTest
+from mtg import builders
+from mtg.model import Model
+from mtg.seeding import STREAMS, generator, childGenerators, seededComment, UniformBlocks
+
+## The streams as released. Models are reproduced from their seed, so these indices must never change
+RELEASED_STREAMS = ["pore radii", "pores", "species", "cell-list", "reference", "template", "tiles", "seams",
+                    "extend pore radii", "extend pores", "extend species", "extend cell-list"]
+
+BUILDS = {
+    "amorphous": lambda seed: builders.amorphousGraphite({"C": 300, "N": 20}, 12.0, 1.2, "test", seed=seed),
+    "layered": lambda seed: builders.amorphousGraphite({"C": 300}, 12.0, 1.2, "test", seed=seed, layers=(3.35, 0.3, 0.8)),
+    "tiled": lambda seed: builders.amorphousGraphite({"C": 400}, 14.0, 1.2, "test", seed=seed, tiles=2),
+    "reference": lambda seed: builders.amorphousGraphite({"C": 60}, 8.0, 1.2, "test", seed=seed, engine="reference"),
+    "porous": lambda seed: builders.porousCarbon({"C": 300}, 3, 15.0, 1.2, 0.3, np.full(3, 3.0), "test", seed=seed),
+    "nanotube": lambda seed: builders.carbonNanotube({"C": 200}, 5.0, 13.0, 6.0, 1.2, "test", seed=seed),
+    "fullerene": lambda seed: builders.fullerene({"C": 200}, 6.0, 6.0, 1.2, "test", seed=seed),
+}
+
+
+def _build(kind, seed):
+    with contextlib.redirect_stdout(io.StringIO()):   # the loops print every atom
+        return BUILDS[kind](seed)
+
+
+def test_stream_indices_are_stable():
+    assert STREAMS[:len(RELEASED_STREAMS)] == RELEASED_STREAMS
+    assert len(set(STREAMS)) == len(STREAMS)
+
+
+def test_stream_is_the_matching_child_of_the_seed():
+    children = np.random.SeedSequence(42).spawn(len(STREAMS))
+    for i, stream in enumerate(STREAMS):
+        assert np.array_equal(generator(42, stream).random(4), np.random.default_rng(children[i]).random(4))
+    keyed = np.random.default_rng(children[STREAMS.index("extend species")].spawn(10)[9])
+    assert np.array_equal(generator(42, "extend species", 9).random(4), keyed.random(4))
+
+
+def test_child_generators_are_independent():
+    a, b = childGenerators(42, "tiles", 2)
+    assert not np.array_equal(a.random(4), b.random(4))
+    assert np.array_equal(childGenerators(42, "tiles", 2)[1].random(4), childGenerators(42, "tiles", 2)[1].random(4))
+
+
+def test_uniform_blocks_hand_out_the_generator_sequence():
+    blocks = UniformBlocks(generator(3, "reference"), block=5)
+    assert [blocks.random() for _ in range(12)] == generator(3, "reference").random(15)[:12].tolist()
+
+
+@pytest.mark.parametrize("kind", list(BUILDS))
+def test_same_seed_gives_the_same_model_bit_for_bit(kind):
+    first, again, other = _build(kind, 123), _build(kind, 123), _build(kind, 124)
+    assert first.poscarText() == again.poscarText()
+    assert first.frac.tobytes() == again.frac.tobytes()
+    assert first.frac.tobytes() != other.frac.tobytes()
+
+
+def test_seed_is_in_the_poscar_comment():
+    model = _build("amorphous", 987654321)
+    assert model.comment == seededComment("test", 987654321) == "test seed=987654321 engine=cell-list"
+    assert Model.fromPoscar(model.poscarText()).comment == "test seed=987654321 engine=cell-list"
+
+
+def test_engine_large_mode_and_tiles_are_in_the_poscar_comment():
+    ## each of them changes the coordinates for the same seed
+    assert _build("reference", 5).comment == "test seed=5 engine=reference"
+    assert _build("tiled", 5).comment == "test seed=5 engine=cell-list tiles=2x2x2"
+    large = builders.amorphousGraphite({"C": 300}, 12.0, 1.2, "test", seed=5, large=True)
+    try:
+        assert large.poscarText(max_atoms=20).splitlines()[0] == "test seed=5 engine=cell-list large-model"
+    finally:
+        large.release()
+
+
+def test_seed_engine_and_large_mode_are_in_the_file_name():
+    app = AppTest.from_file("../pages/Amorphous_Graphite.py", default_timeout=30)
+    app.run()
+    app.number_input(key="seed").set_value(2024).run()
+    assert not app.exception
+    assert app.session_state.atoms_vasp.endswith("_seed2024_cell-list")
+    assert app.session_state.extended_vasp.endswith("_seed2024_cell-list")
+
+    app.selectbox(key="engine").set_value("reference")
+    app.toggle(key="large_model").set_value(True)
+    app.button(key="FormSubmitter:parameters-Apply").click().run()
+    assert app.session_state.atoms_vasp.endswith("_seed2024_reference_large")
+    assert app.session_state.extended_vasp.endswith("_seed2024_cell-list")   # extensions always use the cell-list engine in memory
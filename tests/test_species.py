@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from mtg import builders
+from mtg.placement import minimumImage
+from mtg.species import checkCutoffs, defaultCutoffs, speciesLabels
+
+SPECIES = ["C", "N", "H"]
+COMPOSITION = {"C": 300, "N": 40, "H": 60}
+## H-H kept far apart, C-H allowed closer than C-C
+CUTOFFS = np.array([[1.2, 1.3, 1.0],
+                    [1.3, 1.4, 1.1],
+                    [1.0, 1.1, 2.5]])
+BOX = 14.0
+
+
+def _pairsTooClose(model, box, cutoffs):
+    pos = model.frac.astype(np.float64) * box
+    labels = np.repeat(np.arange(len(model.species)), model.counts)
+    d = minimumImage(pos[:, None, :] - pos[None, :, :], box)
+    r = np.sqrt(np.sum(d**2, axis=2))
+    np.fill_diagonal(r, np.inf)
+    return np.count_nonzero(r < cutoffs[labels[:, None], labels[None, :]] * (1 - 1e-6))
+
+
+def test_doped_model_has_the_exact_counts():
+    model = builders.amorphousGraphite(COMPOSITION, BOX, CUTOFFS, "test", seed=11)
+    assert model.species == SPECIES
+    assert model.counts == [300, 40, 60]
+
+
+def test_doped_model_keeps_every_pair_cutoff():
+    model = builders.amorphousGraphite(COMPOSITION, BOX, CUTOFFS, "test", seed=11)
+    assert _pairsTooClose(model, BOX, CUTOFFS) == 0
+
+
+def test_doped_fullerene_keeps_every_pair_cutoff():
+    model = builders.fullerene(COMPOSITION, 7.0, 6.0, CUTOFFS, "test", seed=12)
+    assert model.counts == [300, 40, 60]
+    ## the sphere sits in the middle of the vacuum box, so plain distances in the box are the true ones
+    assert _pairsTooClose(model, 2 * 7.0 + 6.0, CUTOFFS) == 0
+
+
+def test_species_labels_are_a_shuffle_of_the_counts():
+    labels = speciesLabels([5, 3, 2], np.random.default_rng(0))
+    assert np.bincount(labels).tolist() == [5, 3, 2]
+
+
+def test_default_cutoffs_scale_with_the_covalent_radii():
+    cutoffs = defaultCutoffs(SPECIES, 1.2)
+    assert cutoffs[0, 0] == pytest.approx(1.2)
+    assert np.allclose(cutoffs, cutoffs.T)
+    assert cutoffs[0, 2] == pytest.approx(1.2 * (0.76 + 0.31) / (2 * 0.76))
+
+
+def test_scalar_cutoff_applies_to_every_pair():
+    assert np.array_equal(checkCutoffs(1.2, 3), np.full((3, 3), 1.2))
+
+
+@pytest.mark.parametrize("cutoffs, message", [
+    (np.array([[1.2, 1.3], [1.0, 1.2]]), "symmetric"),
+    (np.array([[1.2, 0.0], [0.0, 1.2]]), "positive"),
+    (np.array([[1.2, -1.0], [-1.0, 1.2]]), "positive"),
+    (np.full((3, 3), 1.2), "2x2"),
+])
+def test_bad_cutoff_matrix_is_rejected(cutoffs, message):
+    with pytest.raises(ValueError, match=message):
+        checkCutoffs(cutoffs, 2)
+    with pytest.raises(ValueError, match=message):
+        builders.amorphousGraphite({"C": 50, "N": 5}, BOX, cutoffs, "test", seed=1)
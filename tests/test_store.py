@@ -0,0 +1,119 @@
+import time
+import os
+import numpy as np
+from streamlit.testing.v1 import AppTest
+from mtg.model import Model
+from mtg.store import ArtifactStore, artifactStore
+
+
+def _model(num_atoms):
+    return Model("test", 10.0, (1.0, 1.0, 1.0), ["C"], [num_atoms], np.random.default_rng(0).random((num_atoms, 3)))
+
+
+def test_least_recently_used_is_evicted_first():
+    store = ArtifactStore(max_bytes=2 * _model(100).nbytes)
+    first, second = store.put(_model(100)), store.put(_model(100))
+    store.get(first)
+    third = store.put(_model(100))
+    assert first in store and third in store and second not in store
+    assert store.nbytes == 2 * _model(100).nbytes
+
+
+def test_drop_frees_the_bytes():
+    store = ArtifactStore()
+    handle = store.put(_model(100))
+    store.drop(handle)
+    store.drop(None)   # nothing generated yet
+    assert len(store) == 0 and store.nbytes == 0
+
+
+def _servePage():
+    import numpy as np
+    from mtg.model import Model
+    from mtg.ui import serveModel
+    serveModel("test_page", Model("test", 10.0, (1.0, 1.0, 1.0), ["C"], [100], np.zeros((100, 3))), "POSCAR_test")
+
+
+def test_regenerating_does_not_grow_the_store():
+    app = AppTest.from_function(_servePage)
+    app.run()
+    size, nbytes = len(artifactStore()), artifactStore().nbytes
+    for _ in range(3):
+        app.run()
+        assert not app.exception
+    assert len(artifactStore()) == size and artifactStore().nbytes == nbytes
+
+
+def test_derived_results_go_with_their_artifact():
+    store = ArtifactStore()
+    handle = store.put(_model(100))
+    store.put(np.zeros(10), handle=handle + "/preview")
+    other = store.put(_model(100))
+    store.put(np.zeros(10), handle=other + "/preview")
+    store.drop(handle)
+    assert len(store) == 2 and other + "/preview" in store
+    assert store.nbytes == _model(100).nbytes + np.zeros(10).nbytes
+
+
+def _previewPage():
+    import numpy as np
+    import streamlit as st
+    from mtg.model import Model
+    from mtg.ui import serveModel, currentModel, modelPreview
+    if "served" not in st.session_state:
+        serveModel("test_page", Model("test", 10.0, (1.0, 1.0, 1.0), ["C"], [5000], np.random.default_rng(0).random((5000, 3))), "POSCAR_test")
+        st.session_state.served = True
+    modelPreview("test_page", currentModel("test_page"))
+
+
+def test_memoised_preview_counts_against_the_store():
+    app = AppTest.from_function(_previewPage)
+    app.run()
+    before = artifactStore().nbytes
+    app.toggle(key="test_page_preview").set_value(True).run()
+    assert not app.exception
+    ## 5000 points in three float64 arrays
+    assert artifactStore().nbytes - before >= 3 * 8 * 5000
+    ## a rerun reuses it
+    after = artifactStore().nbytes
+    app.run()
+    assert artifactStore().nbytes == after
+
+
+def test_large_model_download_closes_its_file():
+    from mtg import builders
+    from mtg.store import poscarDownload
+    model = builders.amorphousGraphite({"C": 300}, 14.0, 1.2, "test", large=True, seed=1)
+    handle = artifactStore().put(model)
+    try:
+        data = poscarDownload(handle)()
+        assert isinstance(data, bytes) and len(data) == model.disk_bytes
+    finally:
+        artifactStore().drop(handle)
+    assert not os.path.exists(model.path)
+
+
+def _failingJobPage():
+    import numpy as np
+    import streamlit as st
+    from mtg import builders
+    from mtg.model import Model
+    from mtg.ui import serveModel, submitJob, jobProgress, currentModel
+    if "served" not in st.session_state:
+        serveModel("test_page", Model("test", 10.0, (1.0, 1.0, 1.0), ["C"], [100], np.zeros((100, 3))), "POSCAR_test")
+        submitJob("test_page", builders.amorphousGraphite, {"C": 100}, 10.0, 1.2, "test", engine="no such engine", file_name="POSCAR_new")
+        st.session_state.served = True
+    jobProgress("test_page")
+    st.write("model" if currentModel("test_page") is not None else "no model")
+
+
+def test_failed_job_keeps_the_current_model():
+    app = AppTest.from_function(_failingJobPage, default_timeout=60)
+    app.run()
+    for _ in range(60):
+        if app.error:
+            break
+        time.sleep(0.5)
+        app.run()
+    assert "Unknown engine" in app.error[0].value
+    assert app.markdown[-1].value == "model"
@@ -0,0 +1,103 @@
+import os
+import numpy as np
+import pytest
+from mtg import templates
+from mtg.templates import DENSITY_TOL, buildTemplate, minimumDistance, templateIndex, amorphousTemplate, nanotubeTemplate, fullereneTemplate
+
+CUTOFF = 1.2
+NUM_ATOMS = 200
+
+
+@pytest.fixture(scope="module")
+def bank(tmp_path_factory):
+    ## one small template of each kind at the pages' densities
+    directory = str(tmp_path_factory.mktemp("templates"))
+    for kind in ["amorphous", "nanotube", "fullerene"]:
+        buildTemplate(kind, NUM_ATOMS, templates.STANDARD_DENSITY[kind], CUTOFF, seed=1, directory=directory)
+    return {meta["kind"]: meta for meta in templateIndex(directory)}, directory
+
+
+def _size(bank, kind, density_ratio=1.0):
+    ## the size that gives the template's density times density_ratio
+    return bank[0][kind]["size"] * density_ratio**(-1/3)
+
+
+def test_match_serves_densities_within_the_tolerance(bank):
+    index, directory = bank
+    for ratio in [1.0, 1 - DENSITY_TOL/2]:
+        meta, scale = templates._match("amorphous", {"C": NUM_ATOMS}, CUTOFF, _size(bank, "amorphous", ratio), directory=directory)
+        assert meta["path"] == index["amorphous"]["path"]
+        assert scale == pytest.approx(ratio**(-1/3))
+    assert templates._match("amorphous", {"C": NUM_ATOMS}, CUTOFF, _size(bank, "amorphous", 1 - 2*DENSITY_TOL), directory=directory) is None
+
+
+def test_match_refuses_a_scale_that_breaks_the_cutoff(bank, tmp_path):
+    index, _ = bank
+    ## the same template, but with its closest atoms right at the cutoff: it can be stretched, never shrunk
+    with np.load(index["amorphous"]["path"]) as npz:
+        data = {k: npz[k] for k in npz.files}
+    data["min_distance"] = CUTOFF
+    np.savez(tmp_path / "tight.npz", **data)
+    assert templates._match("amorphous", {"C": NUM_ATOMS}, CUTOFF, _size(bank, "amorphous", 1 - DENSITY_TOL/2), directory=str(tmp_path)) is not None
+    assert templates._match("amorphous", {"C": NUM_ATOMS}, CUTOFF, _size(bank, "amorphous", 1 + DENSITY_TOL/2), directory=str(tmp_path)) is None
+
+
+def test_match_needs_pure_carbon_and_the_same_cutoff_and_atoms(bank):
+    _, directory = bank
+    size = _size(bank, "amorphous")
+    assert templates._match("amorphous", {"C": NUM_ATOMS - 20, "N": 20}, np.full((2, 2), CUTOFF), size, directory=directory) is None
+    assert templates._match("amorphous", {"C": NUM_ATOMS}, CUTOFF + 0.1, size, directory=directory) is None
+    assert templates._match("amorphous", {"C": NUM_ATOMS + 1}, CUTOFF, size, directory=directory) is None
+    assert templates._match("nanotube", {"C": NUM_ATOMS}, CUTOFF, _size(bank, "nanotube"), aspect_ratio=2.0, directory=directory) is None
+    assert templates._match("amorphous", {"C": NUM_ATOMS}, CUTOFF, size, directory=os.path.join(directory, "missing")) is None
+
+
+def test_served_amorphous_model_keeps_the_box_and_the_cutoff(bank):
+    _, directory = bank
+    for ratio in [1.0, 1 - DENSITY_TOL/2]:   # as built and stretched to a lower density
+        box = _size(bank, "amorphous", ratio)
+        model = amorphousTemplate({"C": NUM_ATOMS}, box, CUTOFF, "test", seed=5, directory=directory)
+        assert model.num_atoms == NUM_ATOMS and model.species == ["C"] and model.scale == box
+        assert np.all((model.frac >= 0) & (model.frac < 1))
+        assert minimumDistance(model.frac * box, box, CUTOFF) >= CUTOFF * (1 - 1e-5)
+        assert "template=" in model.comment and "seed=5" in model.comment
+
+
+def test_served_nanotube_stays_in_its_cylinder_and_keeps_the_cutoff(bank):
+    _, directory = bank
+    radius = _size(bank, "nanotube")
+    height = 2*radius * templates.STANDARD_ASPECT_RATIO
+    model = nanotubeTemplate({"C": NUM_ATOMS}, radius, height, 5.0, CUTOFF, "test", seed=5, directory=directory)
+    pos = model.frac.astype(np.float64) * height
+    assert model.num_atoms == NUM_ATOMS
+    assert np.all(np.hypot(pos[:, 0] - height/2, pos[:, 1] - height/2) <= radius * (1 + 1e-5))
+    assert np.all((pos[:, 2] >= 0) & (pos[:, 2] <= height))
+    assert minimumDistance(pos, (6*radius, 6*radius, height), CUTOFF) >= CUTOFF * (1 - 1e-5)
+
+
+def test_served_fullerene_stays_in_its_sphere_and_keeps_the_cutoff(bank):
+    _, directory = bank
+    radius, vacuum = _size(bank, "fullerene"), 5.0
+    big_box = 2*radius + vacuum
+    model = fullereneTemplate({"C": NUM_ATOMS}, radius, vacuum, CUTOFF, "test", seed=5, directory=directory)
+    pos = model.frac.astype(np.float64) * big_box
+    assert model.num_atoms == NUM_ATOMS
+    assert np.all(np.linalg.norm(pos - big_box/2, axis=1) <= radius * (1 + 1e-5))
+    assert minimumDistance(pos, 3*big_box, CUTOFF) >= CUTOFF * (1 - 1e-5)
+
+
+def test_same_seed_serves_the_same_model(bank):
+    _, directory = bank
+    box = _size(bank, "amorphous")
+    first, again, other = (amorphousTemplate({"C": NUM_ATOMS}, box, CUTOFF, "test", seed=s, directory=directory) for s in [7, 7, 8])
+    assert np.array_equal(first.frac, again.frac) and first.comment == again.comment
+    assert not np.array_equal(first.frac, other.frac)
+
+
+def test_rebuilding_replaces_older_builds_with_the_same_settings(tmp_path):
+    directory = str(tmp_path)
+    first = buildTemplate("fullerene", 100, 2.26, CUTOFF, seed=1, directory=directory)
+    other = buildTemplate("fullerene", 100, 2.0, CUTOFF, seed=1, directory=directory)
+    second = buildTemplate("fullerene", 100, 2.26, CUTOFF, seed=2, directory=directory)
+    assert first != second
+    assert sorted(meta["path"] for meta in templateIndex(directory)) == sorted([other, second])
@@ -0,0 +1,55 @@
+import numpy as np
+from mtg import builders
+from mtg.placement import minimumImage
+from mtg.porosity import modelPores
+from mtg.species import atomMassGram
+from mtg.templates import minimumDistance
+
+CUTOFF = 1.2
+
+
+def _boxLength(num_atoms, density):
+    return (atomMassGram(["C"])[0] * num_atoms / density)**(1/3) / 1e-8
+
+
+def test_seam_conflicts_finds_pairs_across_tile_faces():
+    box = np.full(3, 10.0)
+    tiles = np.array([2, 2, 2])
+    pos = np.array([[4.8, 2.0, 2.0],    # 0: next to the x = 5 face
+                    [5.3, 2.0, 2.0],    # 1: across that face from 0, too close
+                    [9.9, 7.0, 7.0],    # 2: next to the periodic x = 10 face
+                    [0.4, 7.0, 7.0],    # 3: across it from 2, too close
+                    [2.0, 4.5, 2.0],    # 4: next to the y = 5 face
+                    [2.0, 6.0, 2.0],    # 5: across it from 4, but far enough apart
+                    [2.0, 2.0, 8.0]])   # 6: nowhere near a face
+    labels = np.zeros(len(pos), dtype=np.int8)
+    remove = builders._seamConflicts(pos, labels, box, np.array([[CUTOFF]]), box / tiles, tiles)
+    assert sorted(remove) == [1, 3]
+
+
+def test_seam_conflicts_ignores_untiled_axes():
+    ## along z there is a single tile, so atoms near its faces are not on a seam
+    box = np.full(3, 10.0)
+    tiles = np.array([2, 2, 1])
+    pos = np.array([[2.0, 2.0, 9.9], [2.0, 2.0, 0.4]])
+    remove = builders._seamConflicts(pos, np.zeros(2, dtype=np.int8), box, np.array([[CUTOFF]]), box / tiles, tiles)
+    assert len(remove) == 0
+
+
+def test_tiled_amorphous_graphite_keeps_the_cutoff_across_seams():
+    box = _boxLength(2000, 2.44)
+    model = builders.amorphousGraphite({"C": 2000}, box, CUTOFF, "test", seed=3, tiles=2)
+    assert model.num_atoms == 2000
+    assert minimumDistance(model.frac * box, box, CUTOFF) >= CUTOFF * (1 - 1e-6)
+
+
+def test_tiled_porous_carbon_keeps_the_cutoff_and_the_pores():
+    box = _boxLength(1500, 1.0)
+    radii = np.full(4, 0.2 * box)
+    model = builders.porousCarbon({"C": 1500}, 4, box, CUTOFF, 0.3, radii, "test", seed=3, tiles=2)
+    atoms = model.frac[4:] * box
+    assert minimumDistance(atoms, box, CUTOFF) >= CUTOFF * (1 - 1e-6)
+
+    centers, radii = modelPores(model)
+    d = minimumImage(atoms[:, None, :] - centers[None, :, :], box)
+    assert np.all(np.sqrt(np.sum(d**2, axis=2)) >= radii[None, :])